@@ -0,0 +1,67 @@
+import traceback
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QCoreApplication, QEvent, pyqtSignal
+
+
+class SaveTask(QRunnable):
+    """Ejecuta un storage.SaveJob (codificar, escribir, fsync y renombrar) fuera del hilo de la GUI."""
+
+    def __init__(self, job, done_signal):
+        super().__init__()
+        self.job = job
+        self.done_signal = done_signal
+
+    def run(self):
+        try:
+            self.job.run()
+        except Exception as e:
+            traceback.print_exc()
+            self.job.error = e
+        self.done_signal.emit(self.job)
+
+
+class BackgroundSaver(QObject):
+    """
+    Guarda de a un job por vez en un hilo aparte.
+    Los pedidos que llegan mientras hay un guardado en curso se agrupan en uno solo,
+    que toma su instantánea recién cuando el anterior termina.
+    """
+    finished = pyqtSignal(object)  # SaveJob (job.error es None si salió bien)
+    _task_done = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.running = False
+        self.pending = None  # Función que arma el próximo SaveJob
+        self._task_done.connect(self._on_task_done)
+
+    def request(self, make_job):
+        """make_job() se llama en el hilo de la GUI y devuelve un SaveJob o None si no hay nada que guardar."""
+        if self.running:
+            self.pending = make_job
+            return
+
+        job = make_job()
+        if job is None:
+            return
+        self.running = True
+        self.pool.start(SaveTask(job, self._task_done))
+
+    def _on_task_done(self, job):
+        self.running = False
+        self.finished.emit(job)
+
+        if self.pending:
+            make_job = self.pending
+            self.pending = None
+            self.request(make_job)
+
+    def wait(self):
+        """Bloquea hasta que no quede ningún guardado en curso ni pendiente (p. ej. al cerrar)."""
+        while self.running:
+            self.pool.waitForDone()
+            # Entregar ya la notificación encolada del hilo de trabajo
+            # (el slot lo recibe un proxy de PyQt, no self: hay que despachar todas las MetaCall)
+            QCoreApplication.sendPostedEvents(None, QEvent.Type.MetaCall.value)
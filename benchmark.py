@@ -0,0 +1,331 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+
+# Sin ventana: las mediciones no dependen del monitor ni del compositor
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import QSettings, QEventLoop, QT_VERSION_STR, PYQT_VERSION_STR
+from PyQt6.QtGui import QImage, QPainter, QPainterPath, QColor
+from PyQt6.QtWidgets import QApplication
+
+try:
+    import resource
+except ImportError:  # Windows: sin pico de memoria
+    resource = None
+
+from config import ANCHO_LIENZO, ALTO_LIENZO, app_settings
+import image_assets
+import serializers
+import storage
+
+# Benchmarks de lo que más pesa al usar un cuaderno: guardar, abrir, pasar de página,
+# serializar, reconstruir la escena, reordenar capas y pintar la página entera.
+#
+#   python benchmark.py generate bench/cuaderno --pages 20 --strokes 300 --seed 1
+#   python benchmark.py run bench/cuaderno --out resultados.json
+#   python benchmark.py run bench/cuaderno --baseline base.json   (o: compare resultados.json base.json)
+#
+# El cuaderno se genera con una semilla: el mismo comando da siempre los mismos datos, así
+# los resultados de dos versiones del código se pueden comparar.
+
+DEFAULT_THRESHOLD = 0.15  # Más de un 15% por encima de la base cuenta como más lento
+MIN_MS = 0.1  # Diferencias menores son ruido del reloj, no regresiones
+WORDS = ("derivada integral función límite célula energía átomo fotosíntesis revolución "
+         "ecuación vector matriz imperio molécula sintaxis").split()
+PEN_COLORS = ("#000000", "#ff0000", "#0000ff", "#008000", "#cc25fa")
+
+
+# --- GENERADOR ---
+
+def _stroke_path(rng, points):
+    """Trazo a mano alzada: caminata aleatoria con inercia, como la deja el lápiz (solo lineTo)."""
+    x, y = rng.uniform(40, ANCHO_LIENZO - 40), rng.uniform(40, ALTO_LIENZO - 40)
+    dx, dy = rng.uniform(-2, 2), rng.uniform(-2, 2)
+    path = QPainterPath()
+    path.moveTo(x, y)
+    for _ in range(points - 1):
+        dx = max(-4.0, min(4.0, dx + rng.uniform(-0.8, 0.8)))
+        dy = max(-4.0, min(4.0, dy + rng.uniform(-0.8, 0.8)))
+        x = max(0.0, min(ANCHO_LIENZO, x + dx))
+        y = max(0.0, min(ALTO_LIENZO, y + dy))
+        path.lineTo(round(x, 1), round(y, 1))
+    return path
+
+
+def _image_asset(rng, assets_dir, index):
+    """Imagen de prueba (rectángulos de colores al azar, para que no se comprima a nada) ya en assets/ con sus niveles."""
+    width, height = rng.choice(((1600, 1200), (1024, 768), (800, 600)))
+    image = QImage(width, height, QImage.Format.Format_RGB32)
+    base = QColor.fromHsv(rng.randrange(360), 160, 220)
+    painter = QPainter(image)
+    painter.fillRect(image.rect(), base)
+    for _ in range(200):
+        painter.fillRect(rng.randrange(width), rng.randrange(height), rng.randrange(20, 200), rng.randrange(20, 200),
+                         QColor.fromHsv(rng.randrange(360), rng.randrange(256), rng.randrange(256)))
+    painter.end()
+
+    tmp_path = os.path.join(assets_dir, f"tmp-{index}.jpg")
+    image.save(tmp_path, quality=85)
+    name = image_assets.content_name(tmp_path)
+    path = os.path.join(assets_dir, name)
+    os.replace(tmp_path, path)
+    mips = image_assets.write_mips(path)
+    return {"type": "image", "img_filename": name, "img_w": width, "img_h": height, "mips": mips}
+
+
+def _pose(rng, item_id, z, x=0.0, y=0.0, scale=1.0):
+    return {"id": item_id, "pos_x": x, "pos_y": y, "rot": 0.0, "scale": scale, "z": z,
+            "m11": 1.0, "m12": 0.0, "m21": 0.0, "m22": 1.0}
+
+
+def generate_page(rng, assets_dir, layers=1, strokes=200, points=80, texts=5, images=0):
+    """Página en la codificación actual (paleta + capas). Los trazos se reparten entre las capas."""
+    palette = [[color, width] for color in PEN_COLORS for width in (2, 3, 5)]
+    page_layers = []
+    for k in range(layers):
+        items = []
+        for _ in range(strokes // layers + (k < strokes % layers)):
+            item = _pose(rng, f"{rng.getrandbits(64):016x}", len(items))
+            item.update({"type": "path", "geom": serializers.pack_path(_stroke_path(rng, points)),
+                         "pen": rng.randrange(len(palette)), "has_pen": True, "has_fill": False})
+            items.append(item)
+        if k == 0:
+            for _ in range(texts):
+                item = _pose(rng, f"{rng.getrandbits(64):016x}", len(items),
+                             rng.uniform(60, ANCHO_LIENZO - 300), rng.uniform(0, ALTO_LIENZO - 40))
+                item.update({"type": "text", "content": " ".join(rng.choices(WORDS, k=rng.randint(3, 12))),
+                             "font_family": "Arial", "font_size": 12, "color": "#000000"})
+                items.append(item)
+            for _ in range(images):
+                item = _image_asset(rng, assets_dir, len(items))
+                item.update(_pose(rng, f"{rng.getrandbits(64):016x}", len(items),
+                                  rng.uniform(60, 400), rng.uniform(0, 800), 300 / item["img_w"]))
+                items.append(item)
+        page_layers.append({"nombre": f"Capa {k + 1}", "visible": True, "items": items})
+    return {"palette": palette, "layers": page_layers}
+
+
+def generate_notebook(project_dir, seed=1, pages=10, **page_options):
+    """Crea (o reemplaza) una clase con datos sintéticos reproducibles."""
+    if os.path.exists(project_dir):
+        shutil.rmtree(project_dir)
+    assets_dir = os.path.join(project_dir, "assets")
+    os.makedirs(assets_dir)
+    rng = random.Random(seed)
+    store = storage.PageStore(project_dir)
+    for _ in range(pages):
+        store.append(generate_page(rng, assets_dir, **page_options))
+    store.save()
+    return project_dir
+
+
+# --- MEDICIONES ---
+
+def _timed(fn, repeat, setup=None):
+    """Tiempos en ms de `repeat` llamadas a fn (setup corre antes de cada una, sin medirse)."""
+    runs = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": round(statistics.median(runs), 3), "min_ms": round(min(runs), 3),
+            "runs": [round(r, 3) for r in runs]}
+
+
+def _pump(app, until=None, timeout=5.0):
+    """Procesa eventos (timers de precarga, decodificación) hasta que `until()` se cumpla o pase el tiempo."""
+    end = time.perf_counter() + timeout
+    while time.perf_counter() < end:
+        app.processEvents(QEventLoop.ProcessEventsFlag.AllEvents, 50)
+        if until is not None and until():
+            return
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes en macOS, KB en Linux
+
+
+def run_benchmarks(project_dir, repeat=5):
+    """
+    Abre una copia de la clase en una MainWindow sin mostrar y mide cada operación. Los
+    guardados escriben en la copia: el cuaderno generado queda igual para la próxima corrida.
+    Devuelve {nombre: tiempos}.
+    """
+    app = QApplication.instance() or QApplication([sys.argv[0]])
+    work_root = tempfile.mkdtemp(prefix="benchmark-")
+    source_dir = os.path.abspath(project_dir)
+    project_dir = os.path.join(work_root, "Bench", os.path.basename(source_dir))
+    shutil.copytree(source_dir, project_dir)
+
+    # La configuración (de donde la ventana saca su carpeta de datos y adonde la guarda al
+    # cerrar) va a un INI dentro de la copia: la del usuario no se lee ni se toca
+    settings_dir = os.path.join(work_root, "config")
+    QSettings.setDefaultFormat(QSettings.Format.IniFormat)
+    for scope in (QSettings.Scope.UserScope, QSettings.Scope.SystemScope):
+        QSettings.setPath(QSettings.Format.IniFormat, scope, settings_dir)
+    app_settings().setValue("custom_root_dir", work_root)
+    from main_window import MainWindow
+
+    window = MainWindow()
+    results = {}
+    try:
+        results["load"] = _timed(lambda: window.cargar_desde_archivo(project_dir), repeat)
+        page_count = len(window.pages_data)
+        if page_count < 2:
+            raise ValueError("El cuaderno necesita al menos 2 páginas")
+
+        results["page_flip_cold"] = _timed(lambda: window.go_to_page((window.current_page_index + 1) % page_count),
+                                           repeat, setup=window.reset_scene_pool)
+
+        def prefetched():
+            _pump(app, lambda: not window.prefetch_timer.isActive(), timeout=10)
+        results["page_flip_prefetched"] = _timed(
+            lambda: window.go_to_page((window.current_page_index + 1) % page_count), repeat, setup=prefetched)
+
+        # render_layers_to_scene agrega los items a la escena: se vacía antes de cada vuelta,
+        # si no las mediciones siguientes tendrían varias copias de la página
+        page_data = window.pages_data[window.current_page_index]
+
+        def rebuilt():
+            window.scene.clear()
+            window.render_layers_to_scene(page_data)
+        results["render_layers_to_scene"] = _timed(lambda: window.render_layers_to_scene(page_data), repeat,
+                                                   setup=window.scene.clear)
+        # Recién reconstruida la escena los items no tienen la forma serializada en caché
+        results["serialize_current_scene_cold"] = _timed(window.serialize_current_scene, repeat, setup=rebuilt)
+        results["serialize_current_scene_warm"] = _timed(window.serialize_current_scene, repeat)
+        results["actualizar_z_values"] = _timed(window.actualizar_z_values, repeat)
+
+        def paint():
+            image = QImage(ANCHO_LIENZO, ALTO_LIENZO, QImage.Format.Format_ARGB32_Premultiplied)
+            painter = QPainter(image)
+            painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+            window.scene.render(painter)
+            painter.end()
+        results["paint_full_scene"] = _timed(paint, repeat,
+                                             setup=lambda: _pump(app, lambda: False, timeout=0.2))
+
+        def save():
+            window.guardar_archivo()
+            window.saver.wait()
+
+        def touch_current():
+            # Solo cambió la página actual, como después de un trazo nuevo
+            window.pages_data.dirty.clear()
+            window.pages_data.dirty.add(window.pages_data.ids[window.current_page_index])
+        results["save_one_page"] = _timed(save, repeat, setup=touch_current)
+        results["save_all_pages"] = _timed(save, repeat,
+                                           setup=lambda: window.pages_data.dirty.update(window.pages_data.ids))
+    finally:
+        window.pages_data.dirty.clear()  # No reescribir el cuaderno al cerrar
+        window.close()
+        window.settings.sync()  # Si no, los valores pendientes se escriben al salir, ya borrada la copia
+        shutil.rmtree(work_root, ignore_errors=True)
+    return results
+
+
+# --- COMPARACIÓN ---
+
+def compare(current, baseline, threshold=DEFAULT_THRESHOLD):
+    """[(nombre, base ms, actual ms, proporción, ¿más lento?)] de las mediciones que están en las dos."""
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = result["median_ms"] / max(base["median_ms"], MIN_MS)
+        slower = ratio > 1 + threshold and result["median_ms"] - base["median_ms"] > MIN_MS
+        rows.append((name, base["median_ms"], result["median_ms"], ratio, slower))
+    return rows
+
+
+def print_comparison(rows, threshold):
+    print(f"{'medición':32} {'base ms':>10} {'actual ms':>10} {'cambio':>8}")
+    for name, base, cur, ratio, slower in rows:
+        mark = "  MÁS LENTO" if slower else ""
+        change = f"{(cur / base - 1) * 100:+7.1f}%" if base >= MIN_MS else f"{'-':>8}"
+        print(f"{name:32} {base:10.2f} {cur:10.2f} {change}{mark}")
+    slow = sum(r[4] for r in rows)
+    print(f"{slow} mediciones más de un {threshold:.0%} por encima de la base" if slow else "Sin regresiones")
+    return slow
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generador de cuadernos sintéticos y benchmarks sin ventana.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="Crea una clase con datos sintéticos (carpeta/Materia/clase)")
+    gen.add_argument("project_dir")
+    gen.add_argument("--seed", type=int, default=1)
+    gen.add_argument("--pages", type=int, default=10)
+    gen.add_argument("--layers", type=int, default=1, help="Capas por página")
+    gen.add_argument("--strokes", type=int, default=200, help="Trazos por página")
+    gen.add_argument("--points", type=int, default=80, help="Puntos por trazo")
+    gen.add_argument("--texts", type=int, default=5, help="Textos por página")
+    gen.add_argument("--images", type=int, default=0, help="Imágenes por página")
+
+    run = sub.add_parser("run", help="Mide las operaciones sobre una clase generada")
+    run.add_argument("project_dir")
+    run.add_argument("--repeat", type=int, default=5)
+    run.add_argument("--out", help="JSON con los resultados")
+    run.add_argument("--baseline", help="JSON de una corrida anterior con la que comparar")
+    run.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+
+    cmp_ = sub.add_parser("compare", help="Compara dos JSON de resultados")
+    cmp_.add_argument("current")
+    cmp_.add_argument("baseline")
+    cmp_.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        app = QApplication.instance() or QApplication([sys.argv[0]])  # QImage/QPainter para las imágenes
+        start = time.perf_counter()
+        generate_notebook(args.project_dir, args.seed, args.pages, layers=args.layers, strokes=args.strokes,
+                          points=args.points, texts=args.texts, images=args.images)
+        print(f"{args.project_dir}: {args.pages} páginas en {time.perf_counter() - start:.1f} s")
+        return 0
+
+    if args.command == "compare":
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        return 1 if print_comparison(compare(current, baseline, args.threshold), args.threshold) else 0
+
+    results = run_benchmarks(args.project_dir, args.repeat)
+    report = {
+        "meta": {"project": os.path.abspath(args.project_dir), "repeat": args.repeat,
+                 "date": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+                 "qt": QT_VERSION_STR, "pyqt": PYQT_VERSION_STR, "platform": platform.platform()},
+        "results": results,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    for name, result in results.items():
+        print(f"{name:32} {result['median_ms']:10.2f} ms (mín. {result['min_ms']:.2f})")
+    print(f"{'pico de memoria':32} {report['peak_rss_mb']} MB")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        return 1 if print_comparison(compare(report, baseline, args.threshold), args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
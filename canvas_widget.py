@@ -1,8 +1,38 @@
+import math
+from collections import OrderedDict
+
 from PyQt6.QtWidgets import QGraphicsView, QGraphicsScene, QGraphicsItem, QPushButton
-from PyQt6.QtCore import Qt, QRectF, pyqtSignal, QSize
-from PyQt6.QtGui import QPainter, QPen, QColor, QFont, QPainterPath
+from PyQt6.QtCore import Qt, QRect, QRectF, QPointF, pyqtSignal, QSize, QTimer
+from PyQt6.QtGui import QPainter, QPen, QColor, QFont, QPixmap, QImage, QGuiApplication
 
 from config import ANCHO_LIENZO, ALTO_LIENZO
+from spatial_index import SpatialIndex
+
+
+BG_TILE_SIZE = 256  # Lado de cada baldosa de fondo, en píxeles de pantalla
+BG_CACHE_BYTES = 64 * 1024 * 1024  # Tope de memoria de las baldosas de fondo (de todas las escenas)
+MINIMAP_REFRESH_MS = 250  # Intervalo mínimo entre parches del raster del minimapa
+
+
+# Baldosas del fondo ya renderizadas, compartidas por todas las escenas (la hoja es la misma
+# en cada página): (color, zoom, dpr, columna, fila) -> QPixmap, la menos usada primero
+_bg_tiles = OrderedDict()
+_bg_tiles_bytes = 0
+
+
+def _cached_bg_tile(key, render):
+    global _bg_tiles_bytes
+    pixmap = _bg_tiles.get(key)
+    if pixmap is not None:
+        _bg_tiles.move_to_end(key)
+        return pixmap
+    pixmap = render()
+    _bg_tiles[key] = pixmap
+    _bg_tiles_bytes += pixmap.width() * pixmap.height() * 4
+    while _bg_tiles_bytes > BG_CACHE_BYTES and len(_bg_tiles) > 1:
+        _key, old = _bg_tiles.popitem(last=False)
+        _bg_tiles_bytes -= old.width() * old.height() * 4
+    return pixmap
 
 
 class VectorScene(QGraphicsScene):
@@ -15,16 +45,27 @@ class VectorScene(QGraphicsScene):
         self.meta_materia = ""
         self.meta_fecha = ""
         self.meta_pagina = ""
+        self.label_pixmap = None
+
+        # Índice espacial de los items de la página (lo mantienen los comandos del undo)
+        self.spatial_index = SpatialIndex()
+
+    def clear(self):
+        super().clear()
+        self.spatial_index.clear()
 
     def set_metadata(self, materia, fecha, pagina):
         self.meta_materia = materia
         self.meta_fecha = fecha
         self.meta_pagina = pagina
+        self.label_pixmap = self._build_label_pixmap(QGuiApplication.primaryScreen().devicePixelRatio()) \
+            if (materia or fecha) else None
         self.update()
 
-    def drawBackground(self, painter, rect):
-        painter.fillRect(rect, self.bg_color)
+    # --- FONDO ---
 
+    def paint_paper(self, painter):
+        """Hoja, grid y margen en coordenadas de escena."""
         # Hoja
         paper_rect = QRectF(0, 0, ANCHO_LIENZO, ALTO_LIENZO)
         painter.setBrush(Qt.GlobalColor.white)
@@ -48,33 +89,90 @@ class VectorScene(QGraphicsScene):
         painter.setPen(pen_margin)
         painter.drawLine(60, 0, 60, ALTO_LIENZO)
 
-    def drawForeground(self, painter, rect):
-        # Rótulo con información
-        if self.meta_materia or self.meta_fecha:
-            # IMPORTANTE: Evitar dibujar el rótulo en el MiniMapa
-            current_transform = painter.transform()
-            if current_transform.m11() < 0.5:
-                return
+    def drawBackground(self, painter, rect):
+        painter.fillRect(rect, self.bg_color)
+
+        t = painter.transform()
+        zoom = t.m11()
+        if zoom <= 0 or t.m12() or t.m21() or abs(t.m22() - zoom) > 1e-6:
+            # Transformación rara (rotada/deformada): pintar directo
+            self.paint_paper(painter)
+            return
 
-            painter.setTransform(
-                painter.transform().reset())  # Dibujar en coordenadas de pantalla relativas a la escena
+        # Baldosas de BG_TILE_SIZE píxeles de pantalla: se pintan 1:1, sin redibujar las líneas
+        dpr = painter.device().devicePixelRatioF() if painter.device() else 1.0
+        zoom_key = round(zoom, 4)
+        tile_scene = BG_TILE_SIZE / zoom
+        visible = rect.intersected(QRectF(0, 0, ANCHO_LIENZO, ALTO_LIENZO))
+        if visible.isEmpty():
+            return
 
-            # Caja de texto
-            box_rect = QRectF(ANCHO_LIENZO - 250, 10, 240, 70)
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, False)
+        for row in range(int(visible.top() // tile_scene), int(visible.bottom() // tile_scene) + 1):
+            for col in range(int(visible.left() // tile_scene), int(visible.right() // tile_scene) + 1):
+                pixmap = _cached_bg_tile((self.bg_color.rgba(), zoom_key, dpr, col, row),
+                                         lambda: self._render_tile(col, row, zoom, dpr))
+                painter.drawPixmap(QRectF(col * tile_scene, row * tile_scene, tile_scene, tile_scene),
+                                   pixmap, QRectF(pixmap.rect()))
+        painter.restore()
 
-            painter.setPen(QPen(QColor("#555"), 1))
-            painter.setBrush(QColor(255, 255, 255, 200))
-            painter.drawRoundedRect(box_rect, 5, 5)
+    def _render_tile(self, col, row, zoom, dpr):
+        size = int(BG_TILE_SIZE * dpr)
+        pixmap = QPixmap(size, size)
+        pixmap.fill(self.bg_color)
+        p = QPainter(pixmap)
+        p.setRenderHint(QPainter.RenderHint.Antialiasing)
+        p.scale(zoom * dpr, zoom * dpr)
+        tile_scene = BG_TILE_SIZE / zoom
+        p.translate(-col * tile_scene, -row * tile_scene)
+        self.paint_paper(p)
+        p.end()
+        return pixmap
+
+    # --- RÓTULO ---
+
+    def _build_label_pixmap(self, dpr):
+        # Caja de texto (241x71 para que entre el borde)
+        pixmap = QPixmap(int(241 * dpr), int(71 * dpr))
+        pixmap.setDevicePixelRatio(dpr)
+        pixmap.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(pixmap)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        box_rect = QRectF(0.5, 0.5, 240, 70)
+
+        painter.setPen(QPen(QColor("#555"), 1))
+        painter.setBrush(QColor(255, 255, 255, 200))
+        painter.drawRoundedRect(box_rect, 5, 5)
+
+        painter.setPen(Qt.GlobalColor.black)
+        font = QFont("Arial", 10)
+        font.setBold(True)
+        painter.setFont(font)
+
+        painter.drawText(box_rect.adjusted(10, 10, -10, 0), Qt.AlignmentFlag.AlignLeft,
+                         f"Materia: {self.meta_materia}")
+        painter.drawText(box_rect.adjusted(10, 30, -10, 0), Qt.AlignmentFlag.AlignLeft, f"Fecha: {self.meta_fecha}")
+        painter.drawText(box_rect.adjusted(10, 50, -10, 0), Qt.AlignmentFlag.AlignRight, f"Pág: {self.meta_pagina}")
+        painter.end()
+        return pixmap
+
+    def drawForeground(self, painter, rect):
+        # Rótulo con información (ya renderizado en set_metadata)
+        if self.label_pixmap is None:
+            return
+        # IMPORTANTE: Evitar dibujar el rótulo en el MiniMapa
+        if painter.transform().m11() < 0.5:
+            return
 
-            painter.setPen(Qt.GlobalColor.black)
-            font = QFont("Arial", 10)
-            font.setBold(True)
-            painter.setFont(font)
+        dpr = painter.device().devicePixelRatioF() if painter.device() else 1.0
+        if self.label_pixmap.devicePixelRatio() != dpr:
+            self.label_pixmap = self._build_label_pixmap(dpr)
 
-            painter.drawText(box_rect.adjusted(10, 10, -10, 0), Qt.AlignmentFlag.AlignLeft,
-                             f"Materia: {self.meta_materia}")
-            painter.drawText(box_rect.adjusted(10, 30, -10, 0), Qt.AlignmentFlag.AlignLeft, f"Fecha: {self.meta_fecha}")
-            painter.drawText(box_rect.adjusted(10, 50, -10, 0), Qt.AlignmentFlag.AlignRight, f"Pág: {self.meta_pagina}")
+        painter.save()
+        painter.resetTransform()  # Dibujar en coordenadas de pantalla relativas a la escena
+        painter.drawPixmap(QPointF(ANCHO_LIENZO - 250.5, 9.5), self.label_pixmap)
+        painter.restore()
 
 
 class MiniMapWidget(QGraphicsView):
@@ -86,6 +184,17 @@ class MiniMapWidget(QGraphicsView):
         self.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
         self.setStyleSheet("background: #cccccc; border: 1px solid #444;")
         self.setRenderHint(QPainter.RenderHint.Antialiasing)
+        # El viewport no se repinta con cada cambio de la escena: se dibuja desde el raster
+        self.setViewportUpdateMode(QGraphicsView.ViewportUpdateMode.NoViewportUpdate)
+
+        # Raster de baja resolución de la página y zonas pendientes de repintar en él
+        self.raster = None
+        self.raster_key = None  # (escena, escala, dpr) con que se hizo el raster
+        self.dirty_rects = []
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(MINIMAP_REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.patch_raster)
 
         # Estado de visibilidad (expandido/colapsado)
         self.is_expanded = True
@@ -134,6 +243,7 @@ class MiniMapWidget(QGraphicsView):
             self.setStyleSheet("background: transparent; border: none;")
 
         self.update_button_pos()
+        self.viewport().update()
 
         # Forzar actualización de posición en MainWindow
         if self.main_view and hasattr(self.main_view.main, 'update_minimap'):
@@ -150,39 +260,136 @@ class MiniMapWidget(QGraphicsView):
             self.fitInView(self.scene().sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
         super().resizeEvent(event)
 
-    def drawForeground(self, painter, rect):
-        if not self.is_expanded or not self.main_view or not self.scene():
-            return
+    def setScene(self, scene):
+        super().setScene(scene)
+        self.raster_key = None
+        self.dirty_rects = []
 
-        viewport_rect = self.main_view.viewport().rect()
-        visible_scene_poly = self.main_view.mapToScene(viewport_rect)
-        visible_scene_rect = visible_scene_poly.boundingRect()
+    def scene_changed(self, rects):
+        """Anota las zonas cambiadas; el raster se parchea como mucho cada MINIMAP_REFRESH_MS."""
+        if not rects:
+            rects = [self.scene().sceneRect()]
+        self.dirty_rects.extend(rects)
+        if not self.refresh_timer.isActive():
+            self.refresh_timer.start()
 
-        painter.save()
+    # --- RASTER ---
+
+    def _raster_scale(self):
+        return self.transform().m11() * self.viewport().devicePixelRatioF()
+
+    def _current_key(self):
+        return (id(self.scene()), round(self._raster_scale(), 4), self.viewport().devicePixelRatioF())
 
+    def rebuild_raster(self):
         scene_rect = self.scene().sceneRect()
-        path_full = QPainterPath()
-        path_full.addRect(scene_rect)
+        scale = self._raster_scale()
+        self.raster = QImage(max(1, math.ceil(scene_rect.width() * scale)),
+                             max(1, math.ceil(scene_rect.height() * scale)),
+                             QImage.Format.Format_ARGB32_Premultiplied)
+        self.raster.fill(Qt.GlobalColor.transparent)
+        self.raster_key = self._current_key()
+        self.dirty_rects = []
+        self._render_into_raster(QRectF(0, 0, self.raster.width(), self.raster.height()))
+
+    def _render_into_raster(self, pixel_rect):
+        scene_rect = self.scene().sceneRect()
+        scale = self._raster_scale()
+        source = QRectF(scene_rect.left() + pixel_rect.left() / scale, scene_rect.top() + pixel_rect.top() / scale,
+                        pixel_rect.width() / scale, pixel_rect.height() / scale)
+        painter = QPainter(self.raster)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setClipRect(pixel_rect)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        painter.fillRect(pixel_rect, Qt.GlobalColor.transparent)
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_SourceOver)
+        self.scene().render(painter, pixel_rect, source, Qt.AspectRatioMode.IgnoreAspectRatio)
+        painter.end()
+
+    def patch_raster(self):
+        """Vuelve a renderizar solo las zonas del raster que cambiaron."""
+        if not self.scene() or not self.is_expanded or not self.isVisible():
+            return  # Se rehace entero al volver a mostrarse
+        if self.raster is None or self.raster_key != self._current_key():
+            self.rebuild_raster()
+            self.viewport().update()
+            return
 
-        path_visible = QPainterPath()
-        path_visible.addRect(visible_scene_rect)
+        scene_rect = self.scene().sceneRect()
+        scale = self._raster_scale()
+        bounds = QRect(0, 0, self.raster.width(), self.raster.height())
+        patches = []
+        for r in self.dirty_rects:
+            # Alinear hacia afuera a píxeles enteros (+1 por el antialiasing)
+            left = math.floor((r.left() - scene_rect.left()) * scale) - 1
+            top = math.floor((r.top() - scene_rect.top()) * scale) - 1
+            right = math.ceil((r.right() - scene_rect.left()) * scale) + 1
+            bottom = math.ceil((r.bottom() - scene_rect.top()) * scale) + 1
+            rect = QRect(left, top, right - left, bottom - top).intersected(bounds)
+            # Unir con una zona ya anotada si se solapan
+            for i, other in enumerate(patches):
+                if other.intersects(rect):
+                    patches[i] = other.united(rect)
+                    break
+            else:
+                patches.append(rect)
+        self.dirty_rects = []
+
+        # Muchas zonas chicas: un solo render del rectángulo que las contiene
+        if len(patches) > 8:
+            bounding = QRect()
+            for rect in patches:
+                bounding = bounding.united(rect)
+            patches = [bounding]
+        for rect in patches:
+            if not rect.isEmpty():
+                self._render_into_raster(QRectF(rect))
+        self.viewport().update()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.raster_key = None
+
+    # --- PINTADO ---
+
+    def paintEvent(self, event):
+        # Colapsado queda transparente (como lo deja la hoja de estilo): no se pinta nada
+        if not self.is_expanded or not self.scene():
+            return
+        painter = QPainter(self.viewport())
+        painter.fillRect(self.viewport().rect(), QColor("#cccccc"))
 
-        path_overlay = path_full.subtracted(path_visible)
+        if self.raster is None or self.raster_key != self._current_key():
+            self.rebuild_raster()
 
-        overlay_color = QColor(0, 0, 0, 120)
-        painter.setBrush(overlay_color)
-        painter.setPen(Qt.PenStyle.NoPen)
-        painter.drawPath(path_overlay)
+        scene_rect = self.scene().sceneRect()
+        page_rect = self.mapFromScene(scene_rect).boundingRect()
+        dpr = self.viewport().devicePixelRatioF()
+        self.raster.setDevicePixelRatio(dpr)
+        painter.drawImage(page_rect.topLeft(), self.raster)
 
-        scale_x = self.transform().m11()
-        pen_width = 2.0 / scale_x if scale_x > 0 else 2.0
+        if not self.main_view:
+            return
 
-        stroke_pen = QPen(QColor(255, 0, 0), pen_width)
-        painter.setPen(stroke_pen)
+        # Recuadro de lo visible en la vista principal; el resto de la hoja se oscurece
+        visible_scene_rect = self.main_view.mapToScene(self.main_view.viewport().rect()).boundingRect()
+        visible = self.mapFromScene(visible_scene_rect.intersected(scene_rect)).boundingRect()
+        overlay_color = QColor(0, 0, 0, 120)
+        if visible.isEmpty():
+            painter.fillRect(page_rect, overlay_color)
+        else:
+            painter.fillRect(QRect(page_rect.left(), page_rect.top(), page_rect.width(),
+                                   visible.top() - page_rect.top()), overlay_color)
+            painter.fillRect(QRect(page_rect.left(), visible.bottom() + 1, page_rect.width(),
+                                   page_rect.bottom() - visible.bottom()), overlay_color)
+            painter.fillRect(QRect(page_rect.left(), visible.top(),
+                                   visible.left() - page_rect.left(), visible.height()), overlay_color)
+            painter.fillRect(QRect(visible.right() + 1, visible.top(),
+                                   page_rect.right() - visible.right(), visible.height()), overlay_color)
+
+        painter.setPen(QPen(QColor(255, 0, 0), 2))
         painter.setBrush(Qt.BrushStyle.NoBrush)
-        painter.drawRect(visible_scene_rect)
-
-        painter.restore()
+        painter.drawRect(self.mapFromScene(visible_scene_rect).boundingRect())
 
 
 class EditorView(QGraphicsView):
@@ -0,0 +1,262 @@
+import os
+import json
+from datetime import datetime
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, QTimer, QFileSystemWatcher, pyqtSignal
+
+import storage
+
+# Catálogo de la carpeta de datos: materia -> clase -> (fecha, páginas, tamaño, mtime).
+# Se guarda en ROOT_DIR/.catalogo.json, así al abrir la aplicación el árbol sale de ahí sin
+# recorrer el disco. Un hilo aparte lo actualiza con os.scandir y solo vuelve a mirar lo que
+# cambió: las clases cuya carpeta o pages/ cambió de mtime (un stat por clase; guardar una
+# página no toca la carpeta de la materia) y las que se acaban de guardar. El escaneo
+# completo relee todas las clases.
+
+CATALOG_NAME = ".catalogo.json"
+CATALOG_VERSION = 1
+CLASS_DATE_FORMAT = "%d-%m-%Y"  # Nombre de las carpetas que crea "Hoy"
+REFRESH_DELAY_MS = 500  # Los cambios seguidos en disco se juntan en un solo escaneo
+SIZE_DIRS = (storage.PAGES_DIR_NAME, "assets")  # Lo que cuenta para el tamaño (thumbs/ es caché)
+
+
+def catalog_path(root):
+    return os.path.join(root, CATALOG_NAME)
+
+
+def load_catalog(root):
+    """Catálogo guardado ({} si no hay o no se puede leer)."""
+    try:
+        with open(catalog_path(root), "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != CATALOG_VERSION:
+        return {}
+    return data.get("materias", {})
+
+
+def save_catalog(root, materias):
+    path = catalog_path(root)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": CATALOG_VERSION, "materias": materias}, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _dirs(path):
+    """{nombre: mtime_ns} de las subcarpetas (sin las ocultas)."""
+    with os.scandir(path) as entries:
+        return {e.name: e.stat().st_mtime_ns for e in entries
+                if not e.name.startswith(".") and e.is_dir()}
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+
+def _class_mtime(class_dir, dir_mtime):
+    """
+    Guardar una página reescribe su archivo en pages/ sin tocar la carpeta de la clase
+    (el manifiesto solo cambia si cambió la lista de páginas): se miran las dos.
+    """
+    return max(dir_mtime, _mtime(os.path.join(class_dir, storage.PAGES_DIR_NAME)))
+
+
+def _tree_size(path):
+    size = 0
+    try:
+        with os.scandir(path) as entries:
+            for e in entries:
+                if e.is_file():
+                    size += e.stat().st_size
+    except OSError:
+        pass
+    return size
+
+
+def scan_class(class_dir, mtime):
+    """Entrada del catálogo de una clase, o None si la carpeta no es un proyecto."""
+    container = storage.container_path(class_dir)
+    legacy = os.path.join(class_dir, storage.LEGACY_JSON_NAME)
+    pages = None
+    try:
+        if os.path.exists(container):
+            pages = storage.NotebookFile(container).page_count()
+            size = os.path.getsize(container)
+        elif os.path.exists(legacy):
+            pages = len(storage.read_legacy_json(legacy))
+            size = os.path.getsize(legacy)
+        else:
+            return None
+    except (OSError, ValueError, storage.ContainerError) as e:
+        # Cuaderno dañado: se lista igual (sin cantidad de páginas) para poder abrirlo o borrarlo
+        print(f"catálogo {class_dir}: {e}")
+        size = 0
+    size += sum(_tree_size(os.path.join(class_dir, d)) for d in SIZE_DIRS)
+
+    try:
+        fecha = datetime.strptime(os.path.basename(class_dir), CLASS_DATE_FORMAT).date().isoformat()
+    except ValueError:
+        fecha = datetime.fromtimestamp(mtime / 1e9).date().isoformat()
+    return {"fecha": fecha, "paginas": pages, "bytes": size, "mtime": mtime}
+
+
+def scan(root, previous, full=False, stale=()):
+    """
+    Catálogo actualizado a partir de `previous` (que no se modifica) y el conjunto de
+    materias que cambiaron. `stale`: carpetas de clases que hay que releer sí o sí; con
+    `full` se releen todas.
+    """
+    stale = {os.path.normpath(p) for p in stale}
+    materias = {}
+    changed = set()
+    try:
+        subjects = _dirs(root)
+    except OSError as e:
+        print(f"catálogo {root}: {e}")
+        return previous, set()
+
+    for mat, mat_mtime in subjects.items():
+        path_mat = os.path.join(root, mat)
+        old = previous.get(mat)
+        old_clases = old["clases"] if old is not None else {}
+        try:
+            class_dirs = _dirs(path_mat)
+        except OSError as e:
+            print(f"catálogo {path_mat}: {e}")
+            class_dirs = {}
+        clases = {}
+        for clase, dir_mtime in class_dirs.items():
+            class_dir = os.path.join(path_mat, clase)
+            mtime = _class_mtime(class_dir, dir_mtime)
+            entry = old_clases.get(clase)
+            if full or entry is None or entry["mtime"] != mtime or os.path.normpath(class_dir) in stale:
+                entry = scan_class(class_dir, mtime)
+            if entry is not None:
+                clases[clase] = entry
+
+        if old is not None and old["mtime"] == mat_mtime and old["clases"] == clases:
+            materias[mat] = old
+            continue
+        materias[mat] = {"mtime": mat_mtime, "clases": clases}
+        if old is None or old["clases"] != clases:
+            changed.add(mat)
+
+    changed.update(set(previous) - set(materias))
+    return materias, changed
+
+
+class CatalogScanTask(QRunnable):
+    def __init__(self, root, previous, full, stale, done_signal):
+        super().__init__()
+        self.args = (root, previous, full, stale)
+        self.done_signal = done_signal
+
+    def run(self):
+        root, previous = self.args[:2]
+        try:
+            materias, changed = scan(*self.args)
+            if materias != previous:
+                save_catalog(root, materias)
+        except Exception as e:
+            print(f"catálogo {root}: {e}")
+            materias, changed = previous, set()
+        self.done_signal.emit(materias, changed)
+
+
+class CatalogService(QObject):
+    """
+    Mantiene el catálogo de ROOT_DIR al día: un escaneo por vez en un hilo aparte, lanzado
+    a pedido (refresh, class_changed) o cuando QFileSystemWatcher ve cambios en la carpeta de
+    datos o en la de alguna materia. Los pedidos que llegan durante un escaneo se juntan.
+    """
+    changed = pyqtSignal(object)  # set de materias que cambiaron
+    _task_done = pyqtSignal(object, object)
+
+    def __init__(self, root, parent=None):
+        super().__init__(parent)
+        self.root = root
+        self.materias_data = load_catalog(root)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.running = False
+        self.pending = False  # Hubo un pedido durante el escaneo en curso
+        self.pending_full = False
+        self.pending_stale = set()
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(REFRESH_DELAY_MS)
+        self.timer.timeout.connect(self._start)
+
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(lambda _path: self.timer.start())
+        self._watch()
+        self._task_done.connect(self._on_task_done)
+
+    # --- CONSULTAS ---
+
+    def materias(self):
+        return sorted(self.materias_data, key=str.lower)
+
+    def clases(self, materia):
+        """[(nombre, entrada)] de la materia, las más recientes primero."""
+        clases = self.materias_data.get(materia, {}).get("clases", {})
+        return sorted(clases.items(), key=lambda kv: (kv[1]["fecha"], kv[0]), reverse=True)
+
+    def project_dirs(self, materias=None):
+        """Carpetas de todas las clases (o solo de `materias`)."""
+        return [os.path.join(self.root, mat, clase)
+                for mat, data in self.materias_data.items() if materias is None or mat in materias
+                for clase in data["clases"]]
+
+    # --- ACTUALIZACIÓN ---
+
+    def refresh(self, full=False):
+        """Pide un escaneo: el normal relee las clases que cambiaron, el completo las relee todas."""
+        self.pending_full |= full
+        self._start()
+
+    def class_changed(self, project_dir):
+        """La aplicación escribió en esa clase (guardado): se relee en el próximo escaneo."""
+        self.pending_stale.add(project_dir)
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.pool.clear()
+        self.pool.waitForDone()
+
+    def _start(self):
+        if self.running:
+            self.pending = True  # Se retoma al terminar el escaneo en curso
+            return
+        self.timer.stop()
+        self.pending = False
+        full, stale = self.pending_full, self.pending_stale
+        self.pending_full, self.pending_stale = False, set()
+        self.running = True
+        self.pool.start(CatalogScanTask(self.root, self.materias_data, full, stale, self._task_done))
+
+    def _on_task_done(self, materias, changed):
+        self.running = False
+        self.materias_data = materias
+        self._watch()
+        if changed:
+            self.changed.emit(changed)
+        if self.pending or self.pending_full or self.pending_stale:
+            self.timer.start()
+
+    def _watch(self):
+        if not os.path.isdir(self.root):
+            return
+        wanted = {self.root} | {os.path.join(self.root, m) for m in self.materias_data}
+        current = set(self.watcher.directories())
+        if current - wanted:
+            self.watcher.removePaths(list(current - wanted))
+        if wanted - current:
+            self.watcher.addPaths(list(wanted - current))
@@ -1,5 +1,5 @@
 import os
-from PyQt6.QtCore import QStandardPaths
+from PyQt6.QtCore import QStandardPaths, QSettings
 
 # Constantes Globales
 ANCHO_LIENZO = 794  # A4 aprox a 96dpi (210mm)
@@ -22,6 +22,13 @@ docs_path = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.Docu
 DEFAULT_ROOT_DIR = os.path.join(docs_path, "MiEscuelaNotebook")
 ROOT_DIR = DEFAULT_ROOT_DIR
 
+def app_settings():
+    """
+    Configuración del usuario. Respeta QSettings.defaultFormat() (nativo salvo que se cambie):
+    así benchmark.py la puede llevar a un INI temporal sin tocar la del usuario.
+    """
+    return QSettings(QSettings.defaultFormat(), QSettings.Scope.UserScope, "MiEscuelaApp", "VectorNotebook")
+
 def set_root_dir(path):
     global ROOT_DIR
     ROOT_DIR = path
@@ -1,12 +1,44 @@
-from PyQt6.QtWidgets import QGraphicsTextItem, QGraphicsRectItem, QGraphicsItem, QGraphicsLineItem
-from PyQt6.QtCore import Qt, QRectF, QPointF
-from PyQt6.QtGui import QPen, QBrush, QColor, QTransform
+from collections import OrderedDict
+
+from PyQt6.QtWidgets import QGraphicsTextItem, QGraphicsRectItem, QGraphicsItem, QGraphicsLineItem, \
+    QGraphicsPathItem, QGraphicsPixmapItem, QStyleOptionGraphicsItem
+from PyQt6.QtCore import Qt, QRectF, QPointF, QSizeF
+from PyQt6.QtGui import QPen, QBrush, QColor, QTransform, QPainterPath, QPainter, QPicture, QPixmap, QPixmapCache
+
+import image_assets
+import stroke_geometry
+
+# Escalas de dibujo para las que un trazo guarda una versión simplificada (de la más fina a la más gruesa)
+LOD_SCALES = (0.5, 0.25, 0.125, 0.0625)
+LOD_PIXEL_TOLERANCE = 0.5  # Error admitido en píxeles de pantalla
+
+IMAGE_PLACEHOLDER_COLOR = QColor("#f0f0f0")  # Imagen que todavía se está decodificando
+
+# Capas aplanadas: a partir de este tamaño grabado, el QPicture se pinta en baldosas de raster
+FLAT_RASTER_BYTES = 1024 * 1024
+FLAT_TILE_SIZE = 256  # Lado de cada baldosa, en píxeles de pantalla
+FLAT_CACHED_ZOOMS = 2
+FLAT_MAX_TILES = 64  # Baldosas conservadas por zoom (nunca menos que las visibles)
 
 
 class EditableTextItem(QGraphicsTextItem):
     def __init__(self, text, parent=None):
         super().__init__(text, parent)
         self.setTextInteractionFlags(Qt.TextInteractionFlag.TextEditorInteraction)
+        # Forma serializada en caché (ver serializers); se descarta al editar
+        self._ser_cache = None
+        self.document().contentsChanged.connect(self.invalidate_cache)
+
+    def invalidate_cache(self):
+        self._ser_cache = None
+
+    def setFont(self, font):
+        super().setFont(font)
+        self.invalidate_cache()
+
+    def setDefaultTextColor(self, color):
+        super().setDefaultTextColor(color)
+        self.invalidate_cache()
 
     def keyPressEvent(self, event):
         if event.key() == Qt.Key.Key_Escape:
@@ -30,6 +62,254 @@ class EditableTextItem(QGraphicsTextItem):
         super().mouseDoubleClickEvent(event)
 
 
+class StrokeItem(QGraphicsPathItem):
+    """
+    Trazo que se dibuja con menos vértices cuando se ve chico (vista alejada, minimapa).
+    Cada nivel de LOD_SCALES se calcula la primera vez que hace falta y se descarta con setPath.
+    """
+
+    def __init__(self, path=None, parent=None):
+        super().__init__(path if path is not None else QPainterPath(), parent)
+        self._lod_paths = {}  # escala -> path simplificado
+
+    def setPath(self, path):
+        super().setPath(path)
+        self._lod_paths = {}
+
+    def lod_path(self, lod):
+        """Path a dibujar con `lod` píxeles por unidad del item: el nivel más simple que alcanza."""
+        for scale in reversed(LOD_SCALES):
+            if scale >= lod:
+                path = self._lod_paths.get(scale)
+                if path is None:
+                    path = stroke_geometry.polyline_lod(self.path(), LOD_PIXEL_TOLERANCE / scale)
+                    if path is None:
+                        path = self.path()
+                    self._lod_paths[scale] = path
+                return path
+        return self.path()
+
+    def paint(self, painter, option, widget=None):
+        lod = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        if lod >= LOD_SCALES[0] or self.isSelected():
+            super().paint(painter, option, widget)
+            return
+        pen = self.pen()
+        if pen.joinStyle() == Qt.PenJoinStyle.RoundJoin:
+            # A este tamaño la unión redonda ocupa menos de un píxel y es lo más caro del trazado
+            pen.setJoinStyle(Qt.PenJoinStyle.BevelJoin)
+        painter.setPen(pen)
+        painter.setBrush(self.brush())
+        painter.drawPath(self.lod_path(lod))
+
+
+class ImageProxyItem(QGraphicsPixmapItem):
+    """
+    Imagen que ocupa el tamaño de su original pero pinta el nivel de image_assets que
+    corresponde al zoom. Los niveles decodificados viven en QPixmapCache (con límite de
+    memoria), no en el item: de lejos solo se cargan los reducidos.
+    Nada se decodifica al pintar: el nivel que falta se pide a image_decoder() y, mientras
+    llega, se pinta el último que se mostró (o un rectángulo del tamaño de la imagen).
+    """
+
+    def __init__(self, path, size, mips=0, parent=None):
+        super().__init__(parent)
+        self.path = path  # Original: en assets/ o, si aún no se guardó, el archivo insertado
+        self.image_size = size
+        self.mips = mips  # Niveles reducidos que ya están en disco junto al original
+        self._shown = None  # (clave, QPixmap) del último nivel pintado
+        self.setTransformationMode(Qt.TransformationMode.SmoothTransformation)
+
+    def boundingRect(self):
+        return QRectF(self.offset(), QSizeF(self.image_size))
+
+    def shape(self):
+        path = QPainterPath()
+        path.addRect(self.boundingRect())
+        return path
+
+    def contains(self, point):
+        return self.boundingRect().contains(point)
+
+    def image_decoded(self, key, image):
+        pixmap = QPixmapCache.find(key)
+        if pixmap is None:
+            pixmap = QPixmap.fromImage(image)
+            QPixmapCache.insert(key, pixmap)
+        self._shown = (key, pixmap)
+        self.update()
+        # En una capa aplanada lo que se ve es la grabación: hay que rehacerla
+        capa = getattr(self.parentItem(), "capa", None)
+        if capa is not None:
+            capa.contents_changed()
+
+    def level_key(self, scale):
+        """(nivel, clave en QPixmapCache) que se pinta con esa escala de pantalla."""
+        levels = image_assets.mip_count(self.image_size.width(), self.image_size.height())
+        level = image_assets.level_for_scale(scale, levels)
+        return level, f"{self.path}@{level}"
+
+    def decode_now(self, scale):
+        """Decodifica ya, en este hilo, el nivel para esa escala (exportar: se pinta una sola vez)."""
+        level, key = self.level_key(scale)
+        if QPixmapCache.find(key) is None:
+            self.image_decoded(key, image_assets.read_level(self.path, self.image_size, self.mips, level))
+
+    def paint(self, painter, option, widget=None):
+        scale = QStyleOptionGraphicsItem.levelOfDetailFromTransform(painter.worldTransform())
+        level, key = self.level_key(scale)
+
+        pixmap = QPixmapCache.find(key)
+        if pixmap is None and self._shown is not None and self._shown[0] == key:
+            pixmap = self._shown[1]  # No entró en la caché (más grande que su límite)
+        if pixmap is None:
+            image_assets.image_decoder().request(key, self, self.path, self.image_size, self.mips, level)
+            pixmap = self._shown[1] if self._shown is not None else None
+        else:
+            self._shown = (key, pixmap)
+
+        rect = self.boundingRect()
+        if pixmap is None or pixmap.isNull():
+            painter.fillRect(rect, IMAGE_PLACEHOLDER_COLOR)
+            return
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform,
+                              self.transformationMode() == Qt.TransformationMode.SmoothTransformation)
+        painter.drawPixmap(rect, pixmap, QRectF(pixmap.rect()))
+
+
+class LayerItem(QGraphicsItem):
+    """
+    Contenedor invisible de los items de una capa (ver data_models.CapaData).
+    Visibilidad, bloqueo y orden de la capa se fijan una sola vez acá y los hijos lo heredan.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemHasNoContents)
+
+    def boundingRect(self):
+        return QRectF()
+
+    def paint(self, painter, option, widget):
+        pass
+
+
+class FlatLayerItem(QGraphicsItem):
+    """
+    Capa bloqueada dibujada como un solo item (ver CapaData.set_flattened). Los items de la
+    capa se graban una vez en un QPicture y se reproduce eso; si la capa es muy densa, el
+    QPicture se pasa a baldosas de raster por zoom, como el fondo de VectorScene.
+    La grabación se rehace sola, en el próximo pintado, si la capa cambia (p. ej. un deshacer).
+    """
+
+    def __init__(self, capa):
+        super().__init__()
+        self.capa = capa
+        self.picture = None
+        self.bounds = QRectF()
+        self.raster = False
+        self.tiles = OrderedDict()  # (zoom, dpr) -> OrderedDict((columna, fila) -> QPixmap), la menos usada primero
+        self.setAcceptedMouseButtons(Qt.MouseButton.NoButton)
+        self.setFlag(QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+
+    def invalidate(self):
+        self.prepareGeometryChange()
+        self.picture = None
+        self.tiles.clear()
+        self.update()
+
+    def _record(self):
+        picture = QPicture()
+        painter = QPainter(picture)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        option = QStyleOptionGraphicsItem()
+        for item in self.capa.items:
+            # Los contenedores no tienen transformación: la de escena es la del item en la capa
+            painter.setTransform(item.sceneTransform())
+            option.exposedRect = item.boundingRect()
+            item.paint(painter, option, None)
+        painter.end()
+        self.picture = picture
+        self.bounds = self.capa.stash.childrenBoundingRect()
+        self.raster = picture.size() > FLAT_RASTER_BYTES
+
+    def boundingRect(self):
+        if self.picture is None:
+            self._record()
+        return self.bounds
+
+    def shape(self):
+        return QPainterPath()  # No se puede tocar: ni selección ni clics
+
+    def paint(self, painter, option, widget=None):
+        if self.picture is None:
+            self._record()
+        t = painter.transform()
+        zoom = t.m11()
+        if not self.raster or zoom <= 0 or t.m12() or t.m21() or abs(t.m22() - zoom) > 1e-6:
+            painter.drawPicture(0, 0, self.picture)
+            return
+
+        dpr = painter.device().devicePixelRatioF() if painter.device() else 1.0
+        tiles = self._tiles_for(round(zoom, 4), dpr)
+        tile_scene = FLAT_TILE_SIZE / zoom
+        visible = option.exposedRect.intersected(self.bounds)
+        if visible.isEmpty():
+            return
+
+        cols = range(int(visible.left() // tile_scene), int(visible.right() // tile_scene) + 1)
+        rows = range(int(visible.top() // tile_scene), int(visible.bottom() // tile_scene) + 1)
+        visible_keys = [(col, row) for row in rows for col in cols]
+        missing = [key for key in visible_keys if key not in tiles]
+        for key in visible_keys:
+            if key in tiles:
+                tiles.move_to_end(key)
+        if missing:
+            self._render_tiles(tiles, missing, zoom, dpr)
+            # Las visibles quedaron al final: se descartan primero las que hace más que no se ven
+            while len(tiles) > max(FLAT_MAX_TILES, len(visible_keys)):
+                tiles.popitem(last=False)
+
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, False)
+        for row in rows:
+            for col in cols:
+                pixmap = tiles[(col, row)]
+                painter.drawPixmap(QRectF(col * tile_scene, row * tile_scene, tile_scene, tile_scene),
+                                   pixmap, QRectF(pixmap.rect()))
+        painter.restore()
+
+    def _tiles_for(self, zoom, dpr):
+        key = (zoom, dpr)
+        if key in self.tiles:
+            self.tiles.move_to_end(key)
+        else:
+            self.tiles[key] = OrderedDict()
+            while len(self.tiles) > FLAT_CACHED_ZOOMS:
+                self.tiles.popitem(last=False)
+        return self.tiles[key]
+
+    def _render_tiles(self, tiles, missing, zoom, dpr):
+        """Reproduce la grabación una sola vez para todo el bloque de baldosas que faltan y lo corta."""
+        col0 = min(col for col, _row in missing)
+        row0 = min(row for _col, row in missing)
+        ncols = max(col for col, _row in missing) - col0 + 1
+        nrows = max(row for _col, row in missing) - row0 + 1
+        size = int(FLAT_TILE_SIZE * dpr)
+        block = QPixmap(ncols * size, nrows * size)
+        block.fill(Qt.GlobalColor.transparent)
+        p = QPainter(block)
+        p.setRenderHint(QPainter.RenderHint.Antialiasing)
+        p.scale(zoom * dpr, zoom * dpr)
+        tile_scene = FLAT_TILE_SIZE / zoom
+        p.translate(-col0 * tile_scene, -row0 * tile_scene)
+        p.drawPicture(0, 0, self.picture)
+        p.end()
+        for col, row in missing:
+            tiles[(col, row)] = block.copy((col - col0) * size, (row - row0) * size, size, size)
+
+
 # --- SISTEMA DE TRANSFORMACIÓN VISUAL (GIZMO) ---
 
 class HandleItem(QGraphicsRectItem):
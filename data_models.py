@@ -1,6 +1,195 @@
+from bisect import bisect_left
+
+from custom_items import LayerItem, FlatLayerItem
+from spatial_index import scene_index
+
+
+def _z(item):
+    return item.zValue()
+
+
+class LayerItems:
+    """
+    Items de una capa ordenados por su z local.
+    Pertenencia, alta y baja son O(1) (dict por identidad); la lista ordenada se
+    rearma una sola vez, la próxima vez que se recorre, si una baja o un alta fuera
+    del final la dejó vieja.
+    """
+
+    def __init__(self):
+        self._members = {}  # item -> None (solo se usa como conjunto)
+        self._order = []
+        self._stale = False
+
+    def __contains__(self, item):
+        return item in self._members
+
+    def __len__(self):
+        return len(self._members)
+
+    def __bool__(self):
+        return bool(self._members)
+
+    def __iter__(self):
+        return iter(self.ordered())
+
+    def __getitem__(self, index):
+        return self.ordered()[index]
+
+    def ordered(self):
+        if self._stale:
+            self._order = sorted(self._members, key=_z)
+            self._stale = False
+        return self._order
+
+    def index(self, item):
+        if item not in self._members:
+            raise ValueError("item no pertenece a la capa")
+        order = self.ordered()
+        i = bisect_left(order, item.zValue(), key=_z)
+        if i < len(order) and order[i] is item:
+            return i
+        return order.index(item)  # z repetidos: búsqueda lineal
+
+    def add(self, item):
+        """Agrega un item que ya tiene su z local."""
+        self._members[item] = None
+        if not self._stale and (not self._order or self._order[-1].zValue() <= item.zValue()):
+            self._order.append(item)
+        else:
+            self._stale = True
+
+    def discard(self, item):
+        if item in self._members:
+            del self._members[item]
+            if not self._stale and self._order and self._order[-1] is item:
+                self._order.pop()
+            else:
+                self._stale = True
+
+
 class CapaData:
+    """
+    Capa de una página. Sus items cuelgan de `container` (un LayerItem en la escena):
+    la visibilidad, el bloqueo y el z de la capa se fijan en el contenedor y cada item
+    solo tiene un z local, creciente en el orden de `items`.
+
+    Una capa bloqueada puede además aplanarse (set_flattened): sus items pasan a `stash`,
+    un contenedor oculto, y en su lugar se pinta un único FlatLayerItem.
+    """
+
     def __init__(self, nombre):
         self.nombre = nombre
+        self.container = LayerItem()
+        self.container.capa = self  # Item -> capa en O(1): item.parentItem().capa
+        self.stash = None
+        self.flat = None
         self.visible = True
         self.bloqueada = False
-        self.items = []
\ No newline at end of file
+        self.items = LayerItems()
+
+    @property
+    def visible(self):
+        return self.container.isVisible()
+
+    @visible.setter
+    def visible(self, value):
+        self.container.setVisible(value)
+
+    @property
+    def bloqueada(self):
+        return not self.container.isEnabled()
+
+    @bloqueada.setter
+    def bloqueada(self, value):
+        # Un contenedor deshabilitado deselecciona a sus hijos y no les deja recibir eventos
+        self.container.setEnabled(not value)
+
+    @property
+    def flattened(self):
+        return self.flat is not None
+
+    def _holder(self):
+        """De dónde cuelgan los items: el contenedor, o el contenedor oculto si la capa está aplanada."""
+        return self.stash if self.stash is not None else self.container
+
+    def set_flattened(self, value):
+        """
+        Aplana la capa (sus items dejan de pintarse y de estar en el índice espacial; se pinta
+        una grabación de todos ellos) o la vuelve a armar con sus items.
+        """
+        if value == self.flattened:
+            return
+        index = scene_index(self.container.scene())
+        if value:
+            self.stash = LayerItem()
+            self.stash.capa = self
+            self.stash.setVisible(False)
+            self.stash.setParentItem(self.container)
+            for item in self.items:
+                item.setParentItem(self.stash)
+                if index is not None:
+                    index.remove(item)
+            self.flat = FlatLayerItem(self)
+            self.flat.setParentItem(self.container)
+        else:
+            self._detach(self.flat)
+            self.flat = None
+            for item in self.items:
+                item.setParentItem(self.container)
+                if index is not None:
+                    index.insert(item)
+            self._detach(self.stash)
+            self.stash = None
+
+    def _detach(self, child):
+        scene = child.scene()
+        if scene is not None:
+            scene.removeItem(child)
+        else:
+            child.setParentItem(None)
+
+    def contents_changed(self):
+        """Algún item de la capa cambió por fuera de estos métodos (p. ej. una transformación deshecha)."""
+        if self.flat is not None:
+            self.flat.invalidate()
+
+    def add_item(self, item):
+        """Agrega el item encima de todo lo de la capa."""
+        item.setZValue(self.items[-1].zValue() + 1 if self.items else 0)
+        item.setParentItem(self._holder())
+        self.items.add(item)
+        self.contents_changed()
+
+    def insert_items(self, index, items):
+        """Inserta `items` en la posición `index` con z locales entre los de sus vecinos."""
+        if not items:
+            return
+        lo = self.items[index - 1].zValue() if index > 0 else (self.items[0].zValue() - 1 if self.items else -1)
+        hi = self.items[index].zValue() if index < len(self.items) else lo + len(items) + 1
+        step = (hi - lo) / (len(items) + 1)
+        if step < 1e-6:
+            # Se agotó el espacio entre vecinos (muchos reemplazos en el mismo lugar): renumerar la capa
+            self.renumber()
+            lo = index - 1
+            step = 1 / (len(items) + 1)
+
+        for k, item in enumerate(items):
+            item.setZValue(lo + step * (k + 1))
+            item.setParentItem(self._holder())
+            self.items.add(item)
+        self.contents_changed()
+
+    def restore_item(self, item):
+        """Devuelve a la capa un item que conserva su z local (p. ej. al deshacer un borrado)."""
+        item.setParentItem(self._holder())
+        self.items.add(item)
+        self.contents_changed()
+
+    def remove_item(self, item):
+        self.items.discard(item)
+        self.contents_changed()
+
+    def renumber(self):
+        for j, item in enumerate(self.items):
+            item.setZValue(j)
@@ -0,0 +1,248 @@
+import os
+import sys
+import time
+import argparse
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Sin ventana: también en los procesos de trabajo, que vuelven a importar este módulo
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import Qt, QRectF, QSize, QMarginsF
+from PyQt6.QtGui import QImage, QPainter, QPdfWriter, QPageSize, QPageLayout, QTransform
+from PyQt6.QtSvg import QSvgGenerator
+from PyQt6.QtWidgets import QApplication, QStyleOptionGraphicsItem
+
+from config import ANCHO_LIENZO, ALTO_LIENZO, app_settings
+from canvas_widget import VectorScene
+from custom_items import ImageProxyItem
+import serializers
+import storage
+
+# Exportación por lotes de cuadernos a PDF (un archivo por clase), PNG o SVG (uno por página).
+# Cada clase se exporta en un proceso aparte (uno por núcleo): Qt pinta en un solo hilo por
+# proceso, así que el paralelismo tiene que ser de procesos. Las páginas se arman con
+# serializers.build_page_scene, igual que al abrirlas en la aplicación.
+#
+#   python export_notebooks.py                      -> toda la carpeta de datos, en PDF
+#   python export_notebooks.py Materia --format png --scale 2 --out exportado
+
+FORMATS = ("pdf", "png", "svg")
+PDF_RESOLUTION = 300
+PAGE_RECT = QRectF(0, 0, ANCHO_LIENZO, ALTO_LIENZO)
+
+
+class ExportScene(VectorScene):
+    """Escena de una página para exportar: la hoja se pinta como vectores (sin las baldosas de pantalla)."""
+
+    def __init__(self, plain=False):
+        super().__init__()
+        self.plain = plain
+
+    def drawBackground(self, painter, rect):
+        if self.plain:
+            painter.fillRect(PAGE_RECT, Qt.GlobalColor.white)
+        else:
+            self.paint_paper(painter)
+
+
+_app = None
+
+
+def ensure_app():
+    global _app
+    if QApplication.instance() is None:
+        _app = QApplication([sys.argv[0]])  # Hay que guardarla: si se libera, Qt se cae
+
+
+def find_projects(path):
+    """Clases dentro de `path`: una clase, una materia o la carpeta de datos entera."""
+    if storage.is_project(path):
+        return [path]
+    projects = []
+    for entry in sorted(os.scandir(path), key=lambda e: e.name.lower()):
+        if entry.name.startswith(".") or not entry.is_dir():
+            continue
+        if storage.is_project(entry.path):
+            projects.append(entry.path)
+        else:
+            projects.extend(sub.path for sub in sorted(os.scandir(entry.path), key=lambda e: e.name.lower())
+                            if sub.is_dir() and storage.is_project(sub.path))
+    return projects
+
+
+def read_pages(project_dir):
+    """Páginas de la clase, de a una y sin migrar nada (la exportación no escribe en la carpeta de datos)."""
+    container = storage.container_path(project_dir)
+    if os.path.exists(container):
+        notebook = storage.NotebookFile(container)
+        for i in range(notebook.page_count()):
+            yield notebook.read_page(i)
+    else:
+        yield from storage.read_legacy_json(os.path.join(project_dir, storage.LEGACY_JSON_NAME))
+
+
+def build_scene(page_data, assets_dir, plain=False):
+    scene = ExportScene(plain)
+    capas = serializers.build_page_scene(scene, page_data, assets_dir)
+    # Como actualizar_z_values: la capa 0 arriba
+    for i, capa in enumerate(capas):
+        capa.container.setZValue(len(capas) - 1 - i)
+    return scene
+
+
+def render_scene(scene, painter, target, device_scale):
+    """Pinta la página en `target`. Las imágenes se decodifican antes, en el nivel que pide esa escala."""
+    device = QTransform.fromScale(device_scale, device_scale)
+    for item in scene.items():
+        if isinstance(item, ImageProxyItem):
+            item.decode_now(QStyleOptionGraphicsItem.levelOfDetailFromTransform(item.sceneTransform() * device))
+    scene.render(painter, target, PAGE_RECT)
+
+
+def _painter(device):
+    painter = QPainter(device)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+    painter.setRenderHint(QPainter.RenderHint.TextAntialiasing)
+    return painter
+
+
+def export_pdf(project_dir, dest, plain=False):
+    tmp_path = dest + ".tmp"
+    writer = QPdfWriter(tmp_path)
+    writer.setResolution(PDF_RESOLUTION)
+    writer.setPageLayout(QPageLayout(QPageSize(QPageSize.PageSizeId.A4), QPageLayout.Orientation.Portrait,
+                                     QMarginsF(0, 0, 0, 0)))
+    writer.setTitle(os.path.basename(project_dir))
+    assets_dir = os.path.join(project_dir, "assets")
+
+    painter = None
+    count = 0
+    try:
+        for page_data in read_pages(project_dir):
+            if painter is None:
+                painter = _painter(writer)
+            else:
+                writer.newPage()
+            target = QRectF(0, 0, writer.width(), writer.height())
+            render_scene(build_scene(page_data, assets_dir, plain), painter, target, target.width() / ANCHO_LIENZO)
+            count += 1
+    finally:
+        if painter is not None:
+            painter.end()
+    if count:
+        os.replace(tmp_path, dest)
+    elif os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    return count
+
+
+def export_images(project_dir, dest_dir, fmt, scale=1.0, plain=False):
+    """Un PNG o SVG por página en dest_dir (pagina-001.png, ...)."""
+    os.makedirs(dest_dir, exist_ok=True)
+    assets_dir = os.path.join(project_dir, "assets")
+    count = 0
+    for count, page_data in enumerate(read_pages(project_dir), 1):
+        dest = os.path.join(dest_dir, f"pagina-{count:03d}.{fmt}")
+        tmp_path = dest + f".tmp.{fmt}"  # La extensión le dice a Qt el formato
+        scene = build_scene(page_data, assets_dir, plain)
+
+        if fmt == "png":
+            image = QImage(round(ANCHO_LIENZO * scale), round(ALTO_LIENZO * scale), QImage.Format.Format_ARGB32_Premultiplied)
+            image.fill(Qt.GlobalColor.white)
+            painter = _painter(image)
+            render_scene(scene, painter, QRectF(image.rect()), scale)
+            painter.end()
+            if not image.save(tmp_path):
+                raise OSError(f"No se pudo escribir {dest}")
+        else:
+            generator = QSvgGenerator()
+            generator.setFileName(tmp_path)
+            generator.setSize(QSize(ANCHO_LIENZO, ALTO_LIENZO))
+            generator.setViewBox(PAGE_RECT)
+            generator.setTitle(f"{os.path.basename(project_dir)} - {count}")
+            painter = _painter(generator)
+            render_scene(scene, painter, PAGE_RECT, 1.0)
+            painter.end()
+        os.replace(tmp_path, dest)
+    return count
+
+
+def export_project(project_dir, out_dir, fmt, scale=1.0, plain=False):
+    """Exporta una clase a out_dir/<materia>/<clase>[.pdf]. Corre en un proceso de trabajo."""
+    ensure_app()
+    materia = os.path.basename(os.path.dirname(project_dir))
+    dest = os.path.join(out_dir, materia, os.path.basename(project_dir))
+    start = time.perf_counter()
+    try:
+        if fmt == "pdf":
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            pages = export_pdf(project_dir, dest + ".pdf", plain)
+        else:
+            pages = export_images(project_dir, dest, fmt, scale, plain)
+        return project_dir, pages, time.perf_counter() - start, None
+    except Exception:
+        return project_dir, 0, time.perf_counter() - start, traceback.format_exc()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta cuadernos a PDF, PNG o SVG sin abrir la aplicación.")
+    parser.add_argument("paths", nargs="*",
+                        help="Clases, materias o carpeta de datos (por defecto, la carpeta de datos configurada)")
+    parser.add_argument("--format", choices=FORMATS, default="pdf")
+    parser.add_argument("--out", default="exportado", help="Carpeta de salida")
+    parser.add_argument("--scale", type=float, default=2.0, help="Píxeles por punto de la hoja (solo PNG)")
+    parser.add_argument("--plain", action="store_true", help="Hoja blanca, sin grilla ni margen")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Procesos en paralelo")
+    args = parser.parse_args(argv)
+
+    paths = args.paths
+    if not paths:
+        root = app_settings().value("custom_root_dir", "")
+        if not root or not os.path.isdir(root):
+            parser.error("No hay carpeta de datos configurada: indica qué exportar")
+        paths = [root]
+
+    projects = []
+    for path in paths:
+        projects.extend(find_projects(os.path.abspath(path)))
+    if not projects:
+        print("No se encontraron clases para exportar.")
+        return 1
+
+    out_dir = os.path.abspath(args.out)
+    start = time.perf_counter()
+    total_pages = 0
+    failed = []
+
+    def report(result, done):
+        nonlocal total_pages
+        project_dir, pages, seconds, error = result
+        name = os.path.join(os.path.basename(os.path.dirname(project_dir)), os.path.basename(project_dir))
+        if error:
+            failed.append(project_dir)
+            print(f"[{done}/{len(projects)}] ERROR {name}\n{error}")
+        else:
+            total_pages += pages
+            print(f"[{done}/{len(projects)}] {name}: {pages} páginas ({seconds:.1f} s)")
+
+    job_args = (out_dir, args.format, args.scale, args.plain)
+    if args.jobs <= 1:
+        for done, project_dir in enumerate(projects, 1):
+            report(export_project(project_dir, *job_args), done)
+    else:
+        # spawn: cada proceso arranca su propio Qt (no se hereda el estado de este)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(projects)), mp_context=context) as pool:
+            futures = [pool.submit(export_project, project_dir, *job_args) for project_dir in projects]
+            for done, future in enumerate(as_completed(futures), 1):
+                report(future.result(), done)
+
+    print(f"{len(projects) - len(failed)} clases, {total_pages} páginas en {time.perf_counter() - start:.1f} s -> {out_dir}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
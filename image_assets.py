@@ -0,0 +1,168 @@
+import hashlib
+import math
+import os
+
+from PyQt6.QtCore import Qt, QSize, QObject, QRunnable, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QImage, QImageReader
+
+# Imágenes de un proyecto: en assets/ va el original y, al lado, versiones reducidas a la
+# mitad, a la cuarta parte, ... (niveles "mip"). Quien pinta elige el nivel según el zoom y
+# el original solo se decodifica de cerca. Todo acá usa QImage: sirve en hilos de trabajo.
+# Los items decodifican con ImageDecoder (image_decoder()), fuera del hilo de la GUI.
+
+ASSETS_DIR_NAME = "assets"
+MIP_MIN_SIDE = 128  # No se generan niveles con el lado mayor más chico que esto
+MAX_MIPS = 5
+
+
+def content_name(path):
+    """
+    Nombre en assets/ según el contenido: hash + extensión original. La misma imagen
+    insertada varias veces (o en varias páginas) es un solo archivo, y dos imágenes
+    distintas con el mismo nombre ya no se pisan.
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest() + os.path.splitext(path)[1].lower()
+
+
+def mip_count(width, height):
+    """Cantidad de niveles reducidos que corresponden a una imagen de ese tamaño."""
+    n = 0
+    side = max(width, height)
+    while n < MAX_MIPS and side // 2 >= MIP_MIN_SIDE:
+        side //= 2
+        n += 1
+    return n
+
+
+def mip_filename(filename, level):
+    """Nivel 0 = el original; nivel k = lado / 2**k (foto.jpg -> foto@2.jpg)."""
+    if level == 0:
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}@{level}{ext}"
+
+
+def level_for_scale(scale, mips):
+    """Nivel más reducido que todavía tiene al menos un píxel por píxel de pantalla."""
+    if scale <= 0:
+        return mips
+    return max(0, min(mips, int(math.floor(math.log2(1 / scale)))))
+
+
+def image_size(path):
+    """Tamaño de la imagen leyendo solo la cabecera (inválido si no se puede leer)."""
+    return QImageReader(path).size()
+
+
+def write_mips(path):
+    """
+    Escribe los niveles reducidos que falten junto al original `path`. Devuelve cuántos niveles tiene.
+    Cada nivel sale del anterior, así el original se decodifica una sola vez.
+    """
+    size = image_size(path)
+    if not size.isValid():
+        return 0
+    count = mip_count(size.width(), size.height())
+    directory = os.path.dirname(path)
+    filename = os.path.basename(path)
+    targets = [os.path.join(directory, mip_filename(filename, level)) for level in range(1, count + 1)]
+    if all(os.path.exists(t) for t in targets):
+        return count
+
+    image = QImageReader(path).read()
+    if image.isNull():
+        return 0
+    for target in targets:
+        image = image.scaled(max(1, image.width() // 2), max(1, image.height() // 2),
+                             Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        if os.path.exists(target):
+            continue
+        stem, ext = os.path.splitext(target)
+        tmp_path = stem + ".tmp" + ext  # La extensión le dice a Qt el formato
+        if image.save(tmp_path, quality=90):
+            os.replace(tmp_path, target)
+    return count
+
+
+def read_level(path, size, mips, level):
+    """
+    QImage del nivel pedido de la imagen `path` (de tamaño original `size`). Si ese nivel no
+    está en disco (imágenes viejas, o aún no guardadas) se decodifica el original ya reducido.
+    """
+    if 0 < level <= mips:
+        image = QImage(os.path.join(os.path.dirname(path), mip_filename(os.path.basename(path), level)))
+        if not image.isNull():
+            return image
+    reader = QImageReader(path)
+    if level > 0 and size.isValid():
+        reader.setScaledSize(QSize(max(1, size.width() >> level), max(1, size.height() >> level)))
+    return reader.read()
+
+
+# --- DECODIFICACIÓN EN SEGUNDO PLANO ---
+
+class ImageDecodeTask(QRunnable):
+    def __init__(self, key, path, size, mips, level, done_signal):
+        super().__init__()
+        self.key = key
+        self.args = (path, size, mips, level)
+        self.done_signal = done_signal
+
+    def run(self):
+        try:
+            image = read_level(*self.args)
+        except Exception as e:
+            print(f"imagen {self.args[0]}: {e}")
+            image = QImage()
+        self.done_signal.emit(self.key, image)
+
+
+class ImageDecoder(QObject):
+    """
+    Decodifica niveles de imagen en un pool propio y se los entrega (image_decoded) a los
+    items que los pidieron. Cada nivel se decodifica a lo sumo una vez por vez.
+    """
+    _task_done = pyqtSignal(str, QImage)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, QThreadPool.globalInstance().maxThreadCount() // 2))
+        self.waiting = {}  # clave del nivel -> items que lo esperan
+        self._task_done.connect(self._on_task_done)
+
+    def request(self, key, item, path, size, mips, level):
+        items = self.waiting.get(key)
+        if items is not None:
+            if item not in items:
+                items.append(item)
+            return
+        self.waiting[key] = [item]
+        self.pool.start(ImageDecodeTask(key, path, size, mips, level, self._task_done))
+
+    def stop(self):
+        """Descarta lo que falte empezar y espera a las tareas en curso (al cerrar)."""
+        self.pool.clear()
+        self.pool.waitForDone()
+        self.waiting.clear()
+
+    def _on_task_done(self, key, image):
+        for item in self.waiting.pop(key, []):
+            try:
+                item.image_decoded(key, image)
+            except RuntimeError:
+                pass  # El item se borró mientras tanto (p. ej. una escena descartada)
+
+
+_decoder = None
+
+
+def image_decoder():
+    global _decoder
+    if _decoder is None:
+        _decoder = ImageDecoder()
+    return _decoder
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+
+from undo_commands import CommandAdd, CommandDelete, CommandMoveRotate, CommandReplace
+import serializers
+
+# Journal de operaciones: una línea JSON por cambio desde el último guardado completo.
+# Si la app se cierra de golpe, al reabrir la clase se reaplica sobre lo guardado.
+#
+# Registros:
+#   {"op": "add",  "p": pág, "l": capa, "i": índice, "item": {...}}   ("i" ausente = al final)
+#   {"op": "del",  "p": pág, "ids": [...]}
+#   {"op": "pose", "p": pág, "id": ..., "pos_x": ..., ...}
+#   {"op": "page", "p": pág, "data": {...}}   (página entera: cambios de capas)
+
+JOURNAL_NAME = "journal.log"
+SYNC_INTERVAL = 1.0  # Segundos máximos entre fsyncs
+
+
+def journal_path(project_dir):
+    return os.path.join(project_dir, JOURNAL_NAME)
+
+
+class Journal:
+    def __init__(self, project_dir):
+        self.path = journal_path(project_dir)
+        self.file = open(self.path, "ab")
+        self.last_sync = time.monotonic()
+        self.needs_sync = False
+
+    def size(self):
+        return self.file.tell()
+
+    def append(self, record):
+        # flush en cada registro (sobrevive a un cierre de la app); fsync agrupado (corte de luz)
+        self.file.write(json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n")
+        self.file.flush()
+        self.needs_sync = True
+        if time.monotonic() - self.last_sync >= SYNC_INTERVAL:
+            self.sync()
+
+    def sync(self):
+        if self.needs_sync:
+            os.fsync(self.file.fileno())
+            self.needs_sync = False
+        self.last_sync = time.monotonic()
+
+    def truncate_before(self, offset):
+        """Descarta los registros ya cubiertos por un guardado completo (los primeros `offset` bytes)."""
+        self.file.close()
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            tail = f.read()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.file = open(self.path, "ab")
+        self.needs_sync = False
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+def read_records(project_dir):
+    """Lee el journal. Una última línea cortada (crash a mitad de escritura) se ignora."""
+    path = journal_path(project_dir)
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+    return records
+
+
+# --- REGISTROS A PARTIR DE COMANDOS ---
+
+def _layer_of(main_window, item):
+    capa = main_window.capa_de_item(item)
+    if capa is None or capa not in main_window.capas:
+        return None, None
+    return main_window.capas.index(capa), capa
+
+
+def _add_record(main_window, item):
+    layer_index, capa = _layer_of(main_window, item)
+    item_data = serializers.serialize_item(main_window, item)
+    if capa is None or item_data is None:
+        return None
+    return {"op": "add", "p": main_window.current_page_index, "l": layer_index,
+            "i": capa.items.index(item), "item": item_data}
+
+
+def records_for_command(main_window, cmd, undone):
+    """Registros que reproducen el efecto de haber ejecutado (o deshecho) `cmd`."""
+    page = main_window.current_page_index
+    added, removed = [], []
+
+    if isinstance(cmd, CommandAdd):
+        (removed if undone else added).append(cmd.item)
+    elif isinstance(cmd, CommandDelete):
+        items = [item for item, _capa in cmd.items]
+        (added if undone else removed).extend(items)
+    elif isinstance(cmd, CommandReplace):
+        added, removed = ([cmd.old_item], list(cmd.new_items)) if undone else (list(cmd.new_items), [cmd.old_item])
+    elif isinstance(cmd, CommandMoveRotate):
+        record = serializers.serialize_pose(cmd.item)
+        record.update({"op": "pose", "p": page})
+        return [record]
+
+    records = []
+    if removed:
+        records.append({"op": "del", "p": page, "ids": [serializers.item_uid(it) for it in removed]})
+    for item in added:
+        record = _add_record(main_window, item)
+        if record:
+            records.append(record)
+    return records
+
+
+# --- REPRODUCCIÓN ---
+
+def _editable_page(page_data):
+    """Copia editable de una página con ids en todos los items (los antiguos reciben su id implícito)."""
+    layers = []
+    for li, layer in enumerate(serializers.page_layers(page_data)):
+        items = []
+        for ii, item in enumerate(layer.get("items", [])):
+            item = dict(item)
+            item.setdefault("id", serializers.implicit_item_id(li, ii))
+            items.append(item)
+        layers.append(dict(layer, items=items))
+    return {"palette": list(serializers.page_palette(page_data)), "layers": layers}
+
+
+def _apply(page, record):
+    op = record["op"]
+    layers = page["layers"]
+    if op == "add":
+        if record["l"] >= len(layers):
+            return
+        item_id = record["item"].get("id")
+        if any(it.get("id") == item_id for layer in layers for it in layer["items"]):
+            return  # Ya estaba en lo guardado (journal de un guardado que no llegó a recortarlo)
+        items = layers[record["l"]]["items"]
+        index = record.get("i", len(items))
+        items.insert(min(index, len(items)), record["item"])
+    elif op == "del":
+        ids = set(record["ids"])
+        for layer in layers:
+            layer["items"] = [it for it in layer["items"] if it.get("id") not in ids]
+    elif op == "pose":
+        for layer in layers:
+            for it in layer["items"]:
+                if it.get("id") == record["id"]:
+                    it.update({k: v for k, v in record.items() if k not in ("op", "p", "id")})
+
+
+def replay(records, pages):
+    """Aplica los registros sobre un storage.PageStore. Devuelve cuántos se aplicaron."""
+    applied = 0
+    editable = {}
+    for record in records:
+        p = record.get("p", 0)
+        if record["op"] == "page":
+            if p == len(pages):
+                pages.append(record["data"])
+            if p < len(pages):
+                editable[p] = _editable_page(record["data"])
+                applied += 1
+            continue
+        if p >= len(pages):
+            continue
+        if p not in editable:
+            editable[p] = _editable_page(pages[p])
+        _apply(editable[p], record)
+        applied += 1
+
+    for p, page in editable.items():
+        pages[p] = page
+    return applied
@@ -1,5 +1,4 @@
 import sys
-import json
 import os
 import shutil
 import traceback
@@ -9,24 +8,34 @@ from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTo
                              QListWidget, QPushButton, QLabel, QSlider, QColorDialog, QFileDialog,
                              QTreeWidget, QTreeWidgetItem, QMessageBox, QComboBox, QSpinBox,
                              QFontComboBox, QStackedWidget, QFormLayout, QInputDialog, QFrame,
-                             QGraphicsItem, QGraphicsPixmapItem)
-from PyQt6.QtCore import Qt, QSize, QSettings, QTimer
+                             QGraphicsItem, QGraphicsPixmapItem, QLineEdit, QListWidgetItem)
+from PyQt6.QtCore import Qt, QSize, QTimer
 from PyQt6.QtGui import QIcon, QAction, QKeySequence, QPixmap, QPainter, QPen, QColor, QBrush, QFont, QCursor, \
-    QShortcut, QUndoStack
+    QShortcut, QUndoStack, QPixmapCache
 
 # Importamos config para poder modificar ROOT_DIR
 import config
 from config import Herramienta
 from data_models import CapaData
+from custom_items import ImageProxyItem
 # Importamos el nuevo MiniMapWidget
 from canvas_widget import VectorScene, EditorView, MiniMapWidget
 from undo_commands import CommandAdd
+from background_save import BackgroundSaver
+from scene_pool import ScenePool
+from thumbnails import ThumbnailService, PageStrip
+from catalog import CatalogService
+from search_index import SearchIndexService
 
 # Importamos las herramientas refactorizadas
 from tools import pen, eraser, text, zoom, selection, pan, shapes
 
 # Importamos las funciones de serialización
 import serializers
+import storage
+import journal
+import stroke_geometry
+import image_assets
 
 
 class MainWindow(QMainWindow):
@@ -36,7 +45,7 @@ class MainWindow(QMainWindow):
         self.resize(1300, 850)
 
         self.undo_stack = QUndoStack(self)
-        self.settings = QSettings("MiEscuelaApp", "VectorNotebook")
+        self.settings = config.app_settings()
 
         # --- LOGICA DE CARPETA DE DATOS ---
         self.init_data_folder()
@@ -49,19 +58,51 @@ class MainWindow(QMainWindow):
 
         self.load_settings()
 
+        # Guardado en segundo plano (un guardado por vez, los pedidos se agrupan)
+        self.saver = BackgroundSaver(self)
+        self.saver.finished.connect(self.on_save_finished)
+        self.pending_assets = []  # (origen, destino) de imágenes que el próximo guardado copia a assets/
+
+        # Catálogo de materias y clases (persistente, se actualiza en segundo plano)
+        self.catalog = CatalogService(config.ROOT_DIR, self)
+        self.catalog.changed.connect(self.sync_tree)
+
+        # Índice de búsqueda de textos: sigue al catálogo y a los guardados
+        self.search_service = SearchIndexService(config.ROOT_DIR, self)
+        self.catalog.changed.connect(lambda materias: self.search_service.sync(
+            self.catalog.project_dirs(materias), materias))
+        if self.search_service.is_empty():
+            self.search_service.sync(self.catalog.project_dirs())
+
         self.autosave_timer = QTimer(self)
         self.autosave_timer.timeout.connect(self.auto_save)
         self.autosave_timer.start(5 * 60 * 1000)
 
+        # Journal de operaciones entre guardados (recuperación ante cierres inesperados)
+        self.journal = None
+        self.journal_index = 0  # Índice del undo_stack ya volcado al journal
+        self.undo_stack.indexChanged.connect(self.on_undo_index_changed)
+        self.journal_sync_timer = QTimer(self)
+        self.journal_sync_timer.timeout.connect(self.sync_journal)
+        self.journal_sync_timer.start(int(journal.SYNC_INTERVAL * 1000))
+
         # --- GESTIÓN DE PÁGINAS ---
         self.capas = []
-        self.pages_data = []  # Lista de listas de capas (memoria de todas las páginas)
+        self.pages_data = storage.PageStore(budget_bytes=self.page_cache_budget())  # Páginas (LRU, bajo demanda)
         self.current_page_index = 0
         self.current_project_dir = None
 
         self.scene = VectorScene()
         self.view = EditorView(self.scene, self)
 
+        # Escenas vivas de las páginas vecinas (cambio de página instantáneo)
+        self.scene_pool = ScenePool(self.scene_pool_size)
+        self.scene_poolable = False  # La escena actual corresponde a self.pages_data[current_page_index]
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(200)
+        self.prefetch_timer.timeout.connect(self.prefetch_neighbour_scenes)
+
         # --- MINI MAP (NAVIGATOR) ---
         # Lo creamos como hijo de self.view para que flote sobre él
         self.minimap = MiniMapWidget(self.scene, self.view, self.view)
@@ -72,7 +113,7 @@ class MainWindow(QMainWindow):
         # 1. Cuando la vista cambia (zoom/scroll/resize) -> actualizamos posición y contenido del minimapa
         self.view.viewport_changed.connect(self.update_minimap)
         # 2. Cuando el contenido de la escena cambia -> repintamos
-        self.scene.changed.connect(lambda: self.minimap.viewport().update())
+        self.scene.changed.connect(self.on_scene_changed)
 
         # --- LAYOUT CENTRAL ---
         container = QWidget()
@@ -109,6 +150,12 @@ class MainWindow(QMainWindow):
         layout_pages.addWidget(self.btn_next_page)
         layout_pages.addWidget(self.btn_new_page_fast)
 
+        # Tira de miniaturas (se generan en segundo plano y se cachean en thumbs/)
+        self.thumbnail_service = ThumbnailService(self)
+        self.page_strip = PageStrip(self.thumbnail_service)
+        self.page_strip.page_clicked.connect(self.go_to_page)
+
+        layout_main.addWidget(self.page_strip)
         layout_main.addWidget(self.page_controls)
         self.setCentralWidget(container)
 
@@ -182,11 +229,28 @@ class MainWindow(QMainWindow):
             # Forzar repintado del foreground (donde está el recuadro rojo)
             self.minimap.viewport().update()
 
+    def on_scene_changed(self, rects):
+        self.minimap.scene_changed(rects)
+
+    def set_scene(self, scene):
+        """Cambia la escena que muestran la vista y el minimapa."""
+        if scene is self.scene:
+            return
+        self.scene.changed.disconnect(self.on_scene_changed)
+        self.scene = scene
+        self.view.setScene(scene)
+        self.minimap.setScene(scene)
+        if self.minimap.is_expanded:
+            self.minimap.fitInView(scene.sceneRect(), Qt.AspectRatioMode.KeepAspectRatio)
+        scene.changed.connect(self.on_scene_changed)
+
     def init_empty_state(self):
         """Reinicia el estado a una sesión vacía sin archivo."""
-        self.pages_data = []
+        self.pages_data = storage.PageStore(budget_bytes=self.page_cache_budget())
         self.current_page_index = 0
         self.current_project_dir = None
+        self.close_journal()
+        self.reset_scene_pool()
         self.scene.clear()
         self.capas = []
         self.list_capas.clear()
@@ -194,6 +258,7 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("Notebook - Sin Guardar")
         # Guardar el estado inicial de la pagina 1
         self.save_current_page_to_memory()
+        self.update_page_ui()
 
     def setup_tools(self):
         """Inicializa las herramientas."""
@@ -224,16 +289,32 @@ class MainWindow(QMainWindow):
         self.grosor_lapiz = int(self.settings.value("grosor_lapiz", 3))
         self.suavizado_nivel = int(self.settings.value("suavizado", 30))
         self.grosor_borrador = int(self.settings.value("grosor_borrador", 20))
+        # Memoria máxima para páginas parseadas en caché (MB)
+        self.page_cache_mb = int(self.settings.value("page_cache_mb", 64))
+        # Escenas construidas que se mantienen vivas (actual + vecinas)
+        self.scene_pool_size = int(self.settings.value("scene_pool_size", 3))
+        # Memoria para niveles de imagen decodificados (QPixmapCache, compartida por todas las páginas)
+        self.image_cache_mb = int(self.settings.value("image_cache_mb", 96))
+        QPixmapCache.setCacheLimit(self.image_cache_mb * 1024)
+        # Pintar las capas bloqueadas como un solo dibujo grabado (ver CapaData.set_flattened)
+        self.aplanar_bloqueadas = self.settings.value("aplanar_bloqueadas", True, type=bool)
 
         font_family = self.settings.value("font_family", "Arial")
         font_size = int(self.settings.value("font_size", 12))
         self.font_texto = QFont(font_family, font_size)
 
+    def page_cache_budget(self):
+        return self.page_cache_mb * 1024 * 1024
+
     def save_settings(self):
         self.settings.setValue("color", self.color_actual.name())
         self.settings.setValue("grosor_lapiz", self.grosor_lapiz)
         self.settings.setValue("suavizado", self.suavizado_nivel)
         self.settings.setValue("grosor_borrador", self.grosor_borrador)
+        self.settings.setValue("page_cache_mb", self.page_cache_mb)
+        self.settings.setValue("scene_pool_size", self.scene_pool_size)
+        self.settings.setValue("image_cache_mb", self.image_cache_mb)
+        self.settings.setValue("aplanar_bloqueadas", self.aplanar_bloqueadas)
         self.settings.setValue("font_family", self.font_texto.family())
         self.settings.setValue("font_size", self.font_texto.pointSize())
 
@@ -244,9 +325,15 @@ class MainWindow(QMainWindow):
 
     def closeEvent(self, event):
         """Se ejecuta al cerrar la ventana."""
-        # Intentar guardar antes de salir
+        # Intentar guardar antes de salir (y esperar a que el guardado en curso termine)
         if self.current_project_dir:
             self.guardar_archivo()
+        self.saver.wait()
+        self.close_journal()
+        self.thumbnail_service.stop()
+        self.catalog.stop()
+        self.search_service.stop()
+        image_assets.image_decoder().stop()
 
         self.save_settings()
         super().closeEvent(event)
@@ -270,9 +357,9 @@ class MainWindow(QMainWindow):
             if self.scene.selectedItems() and self.herramienta_actual == Herramienta.SELECCION:
                 items_to_del = []
                 for item in self.scene.selectedItems():
-                    for c in self.capas:
-                        if item in c.items and not c.bloqueada:
-                            items_to_del.append((item, c))
+                    c = self.capa_de_item(item)
+                    if c and not c.bloqueada:
+                        items_to_del.append((item, c))
                 if items_to_del:
                     from undo_commands import CommandDelete
                     self.undo_stack.push(CommandDelete(self.scene, items_to_del, self))
@@ -334,6 +421,7 @@ class MainWindow(QMainWindow):
         self.tree_files = QTreeWidget()
         self.tree_files.setHeaderHidden(True)
         self.tree_files.itemDoubleClicked.connect(self.abrir_archivo)
+        self.tree_files.itemExpanded.connect(self.fill_subject)
 
         widget_org = QWidget()
         layout_org = QVBoxLayout()
@@ -341,7 +429,7 @@ class MainWindow(QMainWindow):
 
         h_files = QHBoxLayout()
         btn_refresh = QPushButton("🔄")
-        btn_refresh.clicked.connect(self.refresh_tree)
+        btn_refresh.clicked.connect(lambda: self.refresh_tree(full=True))
         btn_new_subject = QPushButton("➕ Mat")
         btn_new_subject.clicked.connect(self.nueva_materia)
 
@@ -368,6 +456,33 @@ class MainWindow(QMainWindow):
         dock_org.setWidget(widget_org)
         self.addDockWidget(Qt.DockWidgetArea.LeftDockWidgetArea, dock_org)
 
+        # Dock Buscar (textos de todas las clases)
+        dock_search = QDockWidget("Buscar", self)
+        dock_search.setFixedWidth(250)
+        widget_search = QWidget()
+        layout_search = QVBoxLayout()
+        layout_search.setContentsMargins(0, 0, 0, 0)
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Buscar en los textos...")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_results = QListWidget()
+        self.search_results.setWordWrap(True)
+        self.search_results.itemActivated.connect(self.abrir_resultado)
+        # Se busca cuando se deja de escribir un momento
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(200)
+        self.search_timer.timeout.connect(self.buscar)
+        self.search_box.textChanged.connect(self.search_timer.start)
+        self.search_service.updated.connect(self.search_timer.start)
+        layout_search.addWidget(self.search_box)
+        layout_search.addWidget(self.search_results)
+        widget_search.setLayout(layout_search)
+        dock_search.setWidget(widget_search)
+        self.addDockWidget(Qt.DockWidgetArea.LeftDockWidgetArea, dock_search)
+        if not self.search_service.enabled:
+            dock_search.hide()
+
         # 2. Dock Propiedades
         dock_props = QDockWidget("Propiedades", self)
         self.stack_props = QStackedWidget()
@@ -488,7 +603,7 @@ class MainWindow(QMainWindow):
 
         btns_capa = QHBoxLayout()
         btn_add_c = QPushButton("➕")
-        btn_add_c.clicked.connect(lambda: self.add_layer(f"Capa {self.list_capas.count() + 1}"))
+        btn_add_c.clicked.connect(self.nueva_capa)
 
         btn_del_c = QPushButton("🗑️")
         btn_del_c.clicked.connect(self.eliminar_capa)
@@ -501,10 +616,17 @@ class MainWindow(QMainWindow):
         btn_lock_c.setToolTip("Bloquear/Desbloquear")
         btn_lock_c.clicked.connect(self.toggle_capa_bloqueo)
 
+        btn_flat_c = QPushButton("🧊")
+        btn_flat_c.setToolTip("Aplanar las capas bloqueadas (se dibujan más rápido)")
+        btn_flat_c.setCheckable(True)
+        btn_flat_c.setChecked(self.aplanar_bloqueadas)
+        btn_flat_c.toggled.connect(self.set_aplanar_bloqueadas)
+
         btns_capa.addWidget(btn_add_c)
         btns_capa.addWidget(btn_del_c)
         btns_capa.addWidget(btn_hide_c)
         btns_capa.addWidget(btn_lock_c)
+        btns_capa.addWidget(btn_flat_c)
 
         layout_capas.addWidget(self.list_capas)
         layout_capas.addLayout(btns_capa)
@@ -556,6 +678,10 @@ class MainWindow(QMainWindow):
         self.suavizado_nivel = val
         self.lbl_suavizado.setText(f"{val}%")
 
+    def stroke_tolerance(self):
+        """Error admitido al simplificar un trazo nuevo (escena): depende del zoom y del suavizado."""
+        return stroke_geometry.stroke_tolerance(self.view.transform().m11(), self.suavizado_nivel)
+
     def set_grosor_lapiz(self, val):
         self.grosor_lapiz = val
         if self.herramienta_actual == Herramienta.LAPIZ:
@@ -590,16 +716,27 @@ class MainWindow(QMainWindow):
             # Centrar en la vista actual
             pos = self.view.mapToScene(self.view.viewport().rect().center())
 
-        pixmap = QPixmap(path)
-        if pixmap.isNull():
+        # Solo la cabecera: el item decodifica el nivel reducido que pida el zoom
+        size = image_assets.image_size(path)
+        if not size.isValid():
             return
 
-        item = QGraphicsPixmapItem(pixmap)
+        try:
+            name = image_assets.content_name(path)
+        except OSError:
+            return
+
+        item = ImageProxyItem(path, size)
         item.setPos(pos)
         item.setData(Qt.ItemDataRole.UserRole + 1, path)
+        item.setData(Qt.ItemDataRole.UserRole + 2, name)
+        if self.current_project_dir:
+            # La copia (si no está ya) y sus niveles reducidos los escribe el próximo guardado
+            dest = os.path.join(self.current_project_dir, image_assets.ASSETS_DIR_NAME, name)
+            self.pending_assets.append((path, dest))
 
-        if pixmap.width() > 500:
-            item.setScale(500 / pixmap.width())
+        if size.width() > 500:
+            item.setScale(500 / size.width())
 
         capa = self.get_current_layer()
         if capa and not capa.bloqueada:
@@ -613,44 +750,62 @@ class MainWindow(QMainWindow):
 
     def add_layer(self, nombre):
         capa = CapaData(nombre)
+        self.scene.addItem(capa.container)
         self.capas.insert(0, capa)
         self.list_capas.insertItem(0, nombre)
         self.list_capas.setCurrentRow(0)
         self.actualizar_z_values()
 
+    def nueva_capa(self):
+        self.add_layer(f"Capa {self.list_capas.count() + 1}")
+        self.journal_page_snapshot()
+
+    def set_capas(self, capas):
+        """Muestra las capas de la escena actual en la lista de capas (la superior queda seleccionada)."""
+        self.capas = capas
+        self.list_capas.clear()
+        for row, capa in enumerate(capas):
+            self.list_capas.addItem(capa.nombre)
+            self.actualizar_estilo_capa(row)
+        self.list_capas.setCurrentRow(0)
+        self.actualizar_z_values()
+
     def eliminar_capa(self):
         row = self.list_capas.currentRow()
         if row == -1 or len(self.capas) <= 1:
             return
 
-        capa = self.capas[row]
-        for item in capa.items:
-            self.scene.removeItem(item)
+        # Quitar el contenedor saca de la escena a todos los items de la capa
+        self.scene.removeItem(self.capas[row].container)
 
         self.capas.pop(row)
         self.list_capas.takeItem(row)
         self.actualizar_z_values()
+        self.journal_page_snapshot()
 
     def toggle_capa_visibilidad(self):
         row = self.list_capas.currentRow()
         if row != -1:
             capa = self.capas[row]
             capa.visible = not capa.visible
-            for item in capa.items:
-                item.setVisible(capa.visible)
 
             self.actualizar_estilo_capa(row)
+            self.journal_page_snapshot()
 
     def toggle_capa_bloqueo(self):
         row = self.list_capas.currentRow()
         if row != -1:
             capa = self.capas[row]
             capa.bloqueada = not capa.bloqueada
-            if capa.bloqueada:
-                for item in capa.items:
-                    item.setSelected(False)
+            # Al desbloquear se vuelve a armar con sus items
+            capa.set_flattened(capa.bloqueada and self.aplanar_bloqueadas)
             self.actualizar_estilo_capa(row)
 
+    def set_aplanar_bloqueadas(self, value):
+        self.aplanar_bloqueadas = value
+        for capa in self.capas:
+            capa.set_flattened(capa.bloqueada and value)
+
     def actualizar_estilo_capa(self, row):
         item_list = self.list_capas.item(row)
         capa = self.capas[row]
@@ -672,6 +827,20 @@ class MainWindow(QMainWindow):
                     c.nombre = new_name
                     break
             self.actualizar_estilo_capa(self.list_capas.row(item))
+            self.journal_page_snapshot()
+
+    @property
+    def spatial_index(self):
+        """Índice espacial de la página actual (spatial_index.SpatialIndex), para las herramientas."""
+        return self.scene.spatial_index
+
+    def capa_de_item(self, item):
+        """Capa a la que pertenece un item de la escena (None si no es de ninguna)."""
+        container = item.parentItem()
+        capa = getattr(container, "capa", None)
+        if capa is not None and item in capa.items:
+            return capa
+        return None
 
     def on_capa_selected(self, index):
         pass
@@ -693,39 +862,136 @@ class MainWindow(QMainWindow):
                     break
         self.capas = nuevas_capas
         self.actualizar_z_values()
+        self.journal_page_snapshot()
+
+    def actualizar_z_values(self, capas=None):
+        """Apila los contenedores de capa (la 0 arriba). Los items ya tienen su z local."""
+        if capas is None:
+            capas = self.capas
+        total = len(capas)
+        for i, capa in enumerate(capas):
+            capa.container.setZValue(total - 1 - i)
+
+    # --- JOURNAL ---
+
+    def open_journal(self, project_path):
+        """Reaplica el journal que haya quedado de una sesión anterior y empieza uno nuevo."""
+        self.close_journal()
+        records = journal.read_records(project_path)
+        if records:
+            applied = journal.replay(records, self.pages_data)
+            self.pages_data.save()
+            print(f"journal: {applied} operaciones recuperadas")
+        if os.path.exists(journal.journal_path(project_path)):
+            os.remove(journal.journal_path(project_path))
+        self.journal = journal.Journal(project_path)
+        self.journal_index = self.undo_stack.index()
+
+    def close_journal(self):
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+    def sync_journal(self):
+        if self.journal:
+            self.journal.sync()
+
+    def on_undo_index_changed(self, index):
+        """Vuelca al journal los comandos ejecutados o deshechos desde el último índice visto."""
+        if self.journal is None or self.undo_stack.count() == 0:
+            # Sin proyecto, o pila vaciada al cambiar de página: nada que registrar
+            self.journal_index = index
+            return
 
-    def actualizar_z_values(self):
-        total = len(self.capas)
-        for i, capa in enumerate(self.capas):
-            base_z = (total - 1 - i) * 10000
-            for j, item in enumerate(capa.items):
-                item.setZValue(base_z + j)
-
-    def refresh_tree(self):
-        self.tree_files.clear()
-        try:
-            if not os.path.exists(config.ROOT_DIR):
-                return
+        if index > self.journal_index:
+            steps = [(self.undo_stack.command(i), False) for i in range(self.journal_index, index)]
+        else:
+            steps = [(self.undo_stack.command(i), True) for i in reversed(range(index, self.journal_index))]
+        self.journal_index = index
+
+        for cmd, undone in steps:
+            for record in journal.records_for_command(self, cmd, undone):
+                self.journal.append(record)
+
+    def journal_page_snapshot(self):
+        """Los cambios de capas no pasan por el undo_stack: se registra la página entera."""
+        if self.journal:
+            self.journal.append({"op": "page", "p": self.current_page_index,
+                                 "data": serializers.serialize_current_scene(self)})
+
+    def refresh_tree(self, full=False):
+        """Muestra el catálogo guardado y pide un escaneo (el completo revisa también cada clase)."""
+        self.sync_tree()
+        self.catalog.refresh(full)
+
+    def sync_tree(self, changed=None):
+        """
+        Alinea las materias del árbol con el catálogo. Las clases de una materia se cargan
+        recién al desplegarla (fill_subject); de las materias `changed` (None = todas) solo
+        se recargan las ya desplegadas.
+        """
+        materias = self.catalog.materias()
+        wanted = set(materias)
+        existing = {}
+        for i in reversed(range(self.tree_files.topLevelItemCount())):
+            item = self.tree_files.topLevelItem(i)
+            if item.text(0) in wanted:
+                existing[item.text(0)] = item
+            else:
+                self.tree_files.takeTopLevelItem(i)
 
-            materias = [d for d in os.listdir(config.ROOT_DIR) if os.path.isdir(os.path.join(config.ROOT_DIR, d))]
-            for mat in materias:
+        for i, mat in enumerate(materias):
+            item_mat = existing.get(mat)
+            if item_mat is None:
                 item_mat = QTreeWidgetItem([mat])
                 item_mat.setIcon(0, QIcon(self.style().standardIcon(self.style().StandardPixmap.SP_DirIcon)))
-                path_mat = os.path.join(config.ROOT_DIR, mat)
-
-                clases = [d for d in os.listdir(path_mat) if os.path.isdir(os.path.join(path_mat, d))]
-                for clase in clases:
-                    full_path_clase = os.path.join(path_mat, clase)
-                    json_check = os.path.join(full_path_clase, "data.json")
-                    if os.path.exists(json_check):
-                        item_clase = QTreeWidgetItem([clase])
-                        item_clase.setIcon(0, QIcon(self.style().standardIcon(self.style().StandardPixmap.SP_FileIcon)))
-                        item_clase.setData(0, Qt.ItemDataRole.UserRole, full_path_clase)
-                        item_mat.addChild(item_clase)
-
-                self.tree_files.addTopLevelItem(item_mat)
-        except Exception as e:
-            traceback.print_exc()
+                item_mat.setChildIndicatorPolicy(QTreeWidgetItem.ChildIndicatorPolicy.ShowIndicator)
+                self.tree_files.insertTopLevelItem(i, item_mat)
+            elif item_mat.data(0, Qt.ItemDataRole.UserRole + 1) and (changed is None or mat in changed):
+                self.fill_subject(item_mat, force=True)
+
+    def fill_subject(self, item_mat, force=False):
+        """Crea los items de las clases de una materia (al desplegarla por primera vez)."""
+        if item_mat.parent() is not None or (item_mat.data(0, Qt.ItemDataRole.UserRole + 1) and not force):
+            return
+        current = self.tree_files.currentItem()
+        current_path = current.data(0, Qt.ItemDataRole.UserRole) if current is not None else None
+
+        item_mat.takeChildren()
+        mat = item_mat.text(0)
+        icon = QIcon(self.style().standardIcon(self.style().StandardPixmap.SP_FileIcon))
+        for clase, info in self.catalog.clases(mat):
+            full_path_clase = os.path.join(config.ROOT_DIR, mat, clase)
+            item_clase = QTreeWidgetItem([clase])
+            item_clase.setIcon(0, icon)
+            item_clase.setData(0, Qt.ItemDataRole.UserRole, full_path_clase)
+            paginas = "?" if info["paginas"] is None else info["paginas"]
+            item_clase.setToolTip(0, f"{info['fecha']} · {paginas} páginas · {info['bytes'] // 1024} KB")
+            item_mat.addChild(item_clase)
+            if full_path_clase == current_path:
+                self.tree_files.setCurrentItem(item_clase)
+
+        item_mat.setData(0, Qt.ItemDataRole.UserRole + 1, True)
+        item_mat.setChildIndicatorPolicy(QTreeWidgetItem.ChildIndicatorPolicy.DontShowIndicatorWhenChildless)
+
+    def buscar(self):
+        self.search_results.clear()
+        for project, page_id, page_no, snippet in self.search_service.search(self.search_box.text()):
+            item = QListWidgetItem(f"{project.replace(os.sep, ' / ')} · pág. {page_no + 1}\n{snippet}")
+            item.setData(Qt.ItemDataRole.UserRole, (os.path.join(config.ROOT_DIR, project), page_id, page_no))
+            self.search_results.addItem(item)
+
+    def abrir_resultado(self, item):
+        """Abre la clase del resultado (si no es la actual) y va a su página."""
+        project_path, page_id, page_no = item.data(Qt.ItemDataRole.UserRole)
+        if not storage.is_project(project_path):
+            return
+        if os.path.normpath(project_path) != os.path.normpath(self.current_project_dir or ""):
+            self.cargar_desde_archivo(project_path)
+            if os.path.normpath(project_path) != os.path.normpath(self.current_project_dir or ""):
+                return  # No se pudo abrir
+        ids = self.pages_data.ids
+        self.go_to_page(ids.index(page_id) if page_id in ids else page_no)
 
     def nueva_materia(self):
         nombre, ok = QInputDialog.getText(self, "Nueva Materia", "Nombre:")
@@ -758,14 +1024,8 @@ class MainWindow(QMainWindow):
                 os.makedirs(project_path)
                 os.makedirs(os.path.join(project_path, "assets"))
 
-                # Crear estructura inicial multipágina
-                initial_data = {
-                    "pages": [],  # Se llenará al guardar la primera vez o por defecto
-                    "version": "2.0"
-                }
-
-                with open(os.path.join(project_path, "data.json"), 'w') as f:
-                    json.dump(initial_data, f)
+                # Crear manifiesto vacío (las páginas se llenan al guardar la primera vez)
+                storage.create_project(project_path)
 
                 self.refresh_tree()
             except Exception as e:
@@ -804,8 +1064,16 @@ class MainWindow(QMainWindow):
             self.save_current_page_to_memory()
             self.load_page_from_memory(self.current_page_index + 1)
 
+    def go_to_page(self, page_index):
+        if page_index != self.current_page_index and 0 <= page_index < len(self.pages_data):
+            self.save_current_page_to_memory()
+            self.load_page_from_memory(page_index)
+
     def save_current_page_to_memory(self):
-        """Serializa la escena actual y la guarda en self.pages_data[self.current_page_index]."""
+        """
+        Serializa la escena actual y la guarda en self.pages_data[self.current_page_index].
+        La página solo queda marcada para guardar si su contenido cambió.
+        """
         # Delegamos al serializador
         page_layers = serializers.serialize_current_scene(self)
 
@@ -829,21 +1097,57 @@ class MainWindow(QMainWindow):
             self.view.set_tool(None)
 
         self.scene.clearSelection()
-        self.scene.clear()
         self.undo_stack.clear()
-        self.capas = []
-        self.list_capas.clear()
 
-        # 2. Cargar datos
+        # 2. La escena saliente queda en el pool (sus datos ya se pasaron a memoria)
+        #    y si la página pedida ya está construida solo se cambia de escena
+        if self.scene_poolable:
+            self.scene_pool.put(self.current_page_index, self.scene, self.capas)
+        entry = self.scene_pool.take(page_index)
+
         self.current_page_index = page_index
-        layers_data = self.pages_data[page_index]
-        self.render_layers_to_scene(layers_data)
+        if entry:
+            scene, capas = entry
+            self.set_scene(scene)
+            self.set_capas(capas)
+        else:
+            if self.scene_poolable:
+                self.set_scene(VectorScene())
+            else:
+                self.scene.clear()
+            self.capas = []
+            self.list_capas.clear()
+            # Si la página aún no se leyó, se lee solo su archivo
+            self.render_layers_to_scene(self.pages_data[page_index])
+
+        self.scene_poolable = True
+        self.scene_pool.evict_outside(page_index, len(self.pages_data))
+        self.prefetch_timer.start()
 
         # 3. Restaurar UI y Herramientas
         self.update_page_ui()
         if hasattr(self, 'herramienta_actual'):
             self.set_herramienta(self.herramienta_actual)
 
+    def reset_scene_pool(self):
+        """Descarta las escenas construidas (al cambiar de proyecto ya no corresponden)."""
+        self.prefetch_timer.stop()
+        self.scene_pool.clear()
+        self.scene_poolable = False
+
+    def prefetch_neighbour_scenes(self):
+        """Construye, de a una por vuelta del bucle de eventos, las escenas vecinas que falten."""
+        assets_dir = os.path.join(self.current_project_dir, "assets") if self.current_project_dir else ""
+        for page_index in self.scene_pool.wanted(self.current_page_index, len(self.pages_data)):
+            if page_index in self.scene_pool:
+                continue
+            scene = VectorScene()
+            capas = serializers.build_page_scene(scene, self.pages_data[page_index], assets_dir)
+            self.actualizar_z_values(capas)
+            self.scene_pool.put(page_index, scene, capas)
+            self.prefetch_timer.start()
+            return
+
     def render_layers_to_scene(self, layers_data):
         # Delegamos al serializador
         serializers.render_layers_to_scene(self, layers_data)
@@ -855,74 +1159,111 @@ class MainWindow(QMainWindow):
         self.btn_prev_page.setEnabled(self.current_page_index > 0)
         self.btn_next_page.setEnabled(self.current_page_index < len(self.pages_data) - 1)
 
+        if (self.page_strip.project_dir != self.current_project_dir
+                or self.page_strip.page_ids != self.pages_data.ids):
+            self.page_strip.set_pages(self.current_project_dir, self.pages_data.ids, self.current_page_index)
+        else:
+            self.page_strip.set_current(self.current_page_index)
+
     def abrir_archivo(self, item, col):
         path = item.data(0, Qt.ItemDataRole.UserRole)
         if path and os.path.exists(path):
             self.cargar_desde_archivo(path)
 
     def guardar_archivo(self, silent=True):
-        try:
-            if not self.current_project_dir:
-                if not silent:
-                    QMessageBox.warning(self, "Error", "No hay un proyecto abierto para guardar.")
-                return
+        """
+        Pide un guardado. La instantánea se toma en el hilo de la GUI y la escritura
+        (codificar, fsync, renombrar) se hace en segundo plano; ver on_save_finished.
+        """
+        if not self.current_project_dir:
+            if not silent:
+                QMessageBox.warning(self, "Error", "No hay un proyecto abierto para guardar.")
+            return
 
-            json_path = os.path.join(self.current_project_dir, "data.json")
+        self.saver.request(lambda: self.make_save_job(silent))
 
+    def make_save_job(self, silent):
+        """Instantánea barata del proyecto: serializa la página actual y toma solo lo modificado."""
+        if not self.current_project_dir:
+            return None
+        try:
             self.save_current_page_to_memory()
 
-            full_data = {
-                "version": "2.0",
-                "pages": self.pages_data
-            }
-
-            with open(json_path, 'w') as f:
-                json.dump(full_data, f)
-
-            print("guardado exitoso")
-            if not silent:
-
-                self.statusBar().showMessage(f"Guardado exitoso (Multipage).", 3000)
-            else:
-                pass
-                # sin statusbar
-                # self.statusBar().showMessage(f"Auto-guardado: {datetime.now().strftime('%H:%M:%S')}", 3000)
-
+            assets, self.pending_assets = self.pending_assets, []
+            job = self.pages_data.snapshot(assets)
         except Exception as e:
             traceback.print_exc()
             if not silent:
                 QMessageBox.critical(self, "Error Fatal", f"No se pudo guardar: {e}")
+            return None
+
+        if job is None:
+            if not silent:
+                self.statusBar().showMessage("Sin cambios que guardar.", 3000)
+            return None
+        job.silent = silent
+        job.store = self.pages_data
+        # Lo que el journal tenga hasta acá queda cubierto por este guardado
+        job.journal = self.journal
+        job.journal_offset = self.journal.size() if self.journal else 0
+        return job
+
+    def on_save_finished(self, job):
+        job.store.finish_save(job)
+
+        if job.error:
+            # Las páginas vuelven a quedar sucias; las imágenes se reintentan en el próximo guardado
+            self.pending_assets.extend(job.assets)
+            if not job.silent:
+                QMessageBox.critical(self, "Error Fatal", f"No se pudo guardar: {job.error}")
+            return
+
+        if job.journal and job.journal is self.journal:
+            self.journal.truncate_before(job.journal_offset)
+
+        # Cambiaron las páginas o el tamaño de la clase, y quizás sus textos
+        self.catalog.class_changed(job.project_dir)
+        self.search_service.pages_saved(job.project_dir, job.pages, job.manifest_ids)
+
+        # Las páginas escritas cambiaron de hash: sus miniaturas quedaron viejas
+        if job.store is self.pages_data:
+            self.page_strip.invalidate([pid for pid, _data in job.pages])
+
+        print(f"guardado exitoso ({len(job.pages)} páginas escritas)")
+        if not job.silent:
+            self.statusBar().showMessage(f"Guardado exitoso (Multipage).", 3000)
+
+    def on_page_written(self, project_dir, page_id, page_data):
+        """El caché de páginas escribió una página sucia al descartarla: lo mismo que tras un guardado."""
+        self.catalog.class_changed(project_dir)
+        self.search_service.pages_saved(project_dir, [(page_id, page_data)])
+        if project_dir == self.current_project_dir:
+            self.page_strip.invalidate([page_id])
 
     def cargar_desde_archivo(self, project_path):
-        """Carga un proyecto. Soporta formato v1 (solo capas) y v2 (paginas)."""
+        """
+        Carga un proyecto desde su manifiesto. Los data.json v1 (solo capas) y v2 (paginas) y el
+        contenedor de un solo archivo se migran automáticamente al abrirlos. Solo se lee la primera página.
+        """
         # Desactivar herramientas por seguridad durante carga
         if hasattr(self, 'view'): self.view.set_tool(None)
 
         self.current_project_dir = project_path
         self.setWindowTitle(f"Notebook - {os.path.basename(project_path)}")
-        json_path = os.path.join(project_path, "data.json")
 
         try:
-            if not os.path.exists(json_path):
+            pages = storage.PageStore.open(project_path, self.page_cache_budget())
+            pages.on_page_written = self.on_page_written
+            if len(pages) == 0:
                 # Archivo nuevo / vacio
                 self.init_empty_state()
                 self.current_project_dir = project_path  # Restaurar path
-                self.pages_data = [[{"nombre": "Capa 1", "visible": True, "items": []}]]
-                self.load_page_from_memory(0)
-                return
+                pages.append([{"nombre": "Capa 1", "visible": True, "items": []}])
 
-            with open(json_path, 'r') as f:
-                data = json.load(f)
-
-            # Detectar formato
-            if "pages" in data:
-                # Formato V2 Multi-page
-                self.pages_data = data["pages"]
-                if not self.pages_data: self.pages_data = [[{"nombre": "Capa 1", "visible": True, "items": []}]]
-            else:
-                # Formato V1 Legacy (Solo capas en root) -> Convertir a página 1
-                legacy_layers = data.get("capas", [])
-                self.pages_data = [legacy_layers]
+            # Las páginas se leen bajo demanda
+            self.reset_scene_pool()
+            self.pages_data = pages
+            self.open_journal(project_path)
 
             # Cargar la primera página
             self.load_page_from_memory(0)
@@ -937,6 +1278,8 @@ class MainWindow(QMainWindow):
             return
         if QMessageBox.question(self, "Borrar",
                                 "¿Seguro que quieres borrar toda esta clase?") == QMessageBox.StandardButton.Yes:
+            self.saver.wait()
             shutil.rmtree(self.current_project_dir)
+            self.search_service.project_removed(self.current_project_dir)
             self.init_empty_state()
             self.refresh_tree()
\ No newline at end of file
@@ -0,0 +1,216 @@
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from export_notebooks import ensure_app, find_projects
+from config import app_settings
+from canvas_widget import VectorScene
+import image_assets
+import serializers
+import storage
+
+# Migración y verificación de toda la carpeta de datos, sin abrir la aplicación (con la
+# aplicación cerrada: escribe en las clases).
+#
+# Por cada clase, en procesos aparte:
+#   - los data.json (v1 "capas" y v2 "pages") y los contenedores v1 pasan al contenedor actual
+#     (PageStore.open: temporal + fsync + rename; el JSON queda como data.json.bak);
+#   - cada página se arma en una escena y se vuelve a serializar dos veces: la segunda vuelta
+#     tiene que dar lo mismo que la primera y conservar todos los items. Las páginas con
+#     codificación anterior (capas sueltas, path_elements, imágenes sin tamaño) que pasan la
+#     prueba se reescriben con la actual;
+#   - las imágenes referenciadas tienen que estar en assets/ (se generan los niveles que falten).
+# Con --check solo se lee y se informa. El informe completo va a un JSON.
+
+REPORT_NAME = "informe-migracion.json"
+
+
+def source_format(project_dir):
+    container = storage.container_path(project_dir)
+    if os.path.exists(container):
+        return f"vnb-v{storage.NotebookFile(container).version}"
+    with open(os.path.join(project_dir, storage.LEGACY_JSON_NAME), "r") as f:
+        return "json-v2" if "pages" in json.load(f) else "json-v1"
+
+
+def _items(page_data):
+    return [item for layer in serializers.page_layers(page_data) for item in layer.get("items", [])]
+
+
+def is_legacy_page(page_data):
+    """¿La página usa una codificación anterior a la actual?"""
+    if not isinstance(page_data, dict) or "palette" not in page_data:
+        return True
+    for item in _items(page_data):
+        if item.get("type") == "path" and "geom" not in item:
+            return True
+        if item.get("type") == "image" and "img_w" not in item:
+            return True
+    return False
+
+
+def _serialize(page_data, assets_dir):
+    scene = VectorScene()
+    return serializers.serialize_capas(scene, serializers.build_page_scene(scene, page_data, assets_dir))
+
+
+def roundtrip(page_data, assets_dir):
+    """
+    (página en la codificación actual, error o None). Falla si la segunda vuelta no
+    reproduce la primera o si se perdieron items (p. ej. una imagen que no se pudo leer).
+    """
+    first = _serialize(page_data, assets_dir)
+    second = _serialize(first, assets_dir)
+    if first != second:
+        return first, "la serialización no es estable"
+    lost = len(_items(page_data)) - len(_items(first))
+    if lost:
+        return first, f"{lost} items no se pudieron reconstruir"
+    return first, None
+
+
+def image_files(page_data):
+    return {item["img_filename"] for item in _items(page_data)
+            if item.get("type") == "image" and item.get("img_filename")}
+
+
+def page_readers(project_dir, store=None):
+    """
+    Una función por página que la lee: de a una, para que una página dañada no impida
+    revisar las siguientes. Sin `store` se lee sin migrar nada.
+    """
+    if store is not None:
+        return [lambda i=i: store[i] for i in range(len(store))]
+    container = storage.container_path(project_dir)
+    if os.path.exists(container):
+        notebook = storage.NotebookFile(container)
+        return [lambda i=i: notebook.read_page(i) for i in range(notebook.page_count())]
+    pages = storage.read_legacy_json(os.path.join(project_dir, storage.LEGACY_JSON_NAME))
+    return [lambda page=page: page for page in pages]
+
+
+def process_project(project_dir, check_only=False):
+    """Migra (o solo verifica) una clase. Corre en un proceso de trabajo; devuelve su parte del informe."""
+    ensure_app()
+    start = time.perf_counter()
+    assets_dir = os.path.join(project_dir, "assets")
+    result = {"project": project_dir, "format": None, "pages": 0, "migrated": False, "upgraded_pages": [],
+              "corrupt_pages": {}, "roundtrip_errors": {}, "missing_assets": [], "error": None}
+    try:
+        result["format"] = source_format(project_dir)
+        store = None
+        if not check_only:
+            result["migrated"] = result["format"] != f"vnb-v{storage.CONTAINER_VERSION}"
+            store = storage.PageStore.open(project_dir)
+        readers = page_readers(project_dir, store)
+        result["pages"] = len(readers)
+
+        images = set()
+        for number, read in enumerate(readers, 1):
+            try:
+                page_data = read()
+            except Exception as e:
+                # Página ilegible (archivo faltante o dañado): se informa y se sigue con la próxima
+                result["corrupt_pages"][number] = f"{type(e).__name__}: {e}"
+                continue
+
+            try:
+                images.update(image_files(page_data))
+                current, error = roundtrip(page_data, assets_dir)
+            except Exception as e:
+                # Datos que no se pueden armar en una escena: la página queda como está
+                error = f"{type(e).__name__}: {e}"
+            if error:
+                result["roundtrip_errors"][number] = error
+            elif store is not None and is_legacy_page(page_data):
+                store[number - 1] = current
+                result["upgraded_pages"].append(number)
+
+        result["missing_assets"] = sorted(name for name in images if not os.path.exists(os.path.join(assets_dir, name)))
+        if store is not None:
+            store.save()
+            for name in images:
+                path = os.path.join(assets_dir, name)
+                if os.path.exists(path):
+                    image_assets.write_mips(path)
+    except Exception:
+        result["error"] = traceback.format_exc()
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def _problems(result):
+    return bool(result["error"] or result["corrupt_pages"] or result["roundtrip_errors"] or result["missing_assets"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migra al formato actual y verifica las clases de la carpeta de datos.")
+    parser.add_argument("paths", nargs="*",
+                        help="Clases, materias o carpeta de datos (por defecto, la carpeta de datos configurada)")
+    parser.add_argument("--check", action="store_true", help="Solo verificar: no escribe nada")
+    parser.add_argument("--report", default=REPORT_NAME, help="Archivo JSON con el informe")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Procesos en paralelo")
+    args = parser.parse_args(argv)
+
+    paths = args.paths
+    if not paths:
+        root = app_settings().value("custom_root_dir", "")
+        if not root or not os.path.isdir(root):
+            parser.error("No hay carpeta de datos configurada: indica qué revisar")
+        paths = [root]
+
+    projects = []
+    for path in paths:
+        projects.extend(find_projects(os.path.abspath(path)))
+    if not projects:
+        print("No se encontraron clases.")
+        return 1
+
+    start = time.perf_counter()
+    results = []
+
+    def report(result, done):
+        results.append(result)
+        name = os.path.join(os.path.basename(os.path.dirname(result["project"])), os.path.basename(result["project"]))
+        status = "ERROR" if result["error"] else ("con problemas" if _problems(result) else "ok")
+        action = " migrada" if result["migrated"] else ""
+        if result["upgraded_pages"]:
+            action += f", {len(result['upgraded_pages'])} páginas actualizadas"
+        print(f"[{done}/{len(projects)}] {name} ({result['format']}, {result['pages']} páginas){action}: {status}")
+
+    if args.jobs <= 1:
+        for done, project_dir in enumerate(projects, 1):
+            report(process_project(project_dir, args.check), done)
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(projects)), mp_context=context) as pool:
+            futures = [pool.submit(process_project, project_dir, args.check) for project_dir in projects]
+            for done, future in enumerate(as_completed(futures), 1):
+                report(future.result(), done)
+
+    results.sort(key=lambda r: r["project"])
+    summary = {
+        "projects": len(results),
+        "migrated": sum(r["migrated"] for r in results),
+        "upgraded_pages": sum(len(r["upgraded_pages"]) for r in results),
+        "with_problems": sum(_problems(r) for r in results),
+        "seconds": round(time.perf_counter() - start, 1),
+        "check_only": args.check,
+    }
+    tmp_path = args.report + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "projects": results}, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, args.report)
+
+    print(f"{summary['projects']} clases: {summary['migrated']} migradas, {summary['upgraded_pages']} páginas "
+          f"actualizadas, {summary['with_problems']} con problemas ({summary['seconds']} s) -> {args.report}")
+    return 1 if summary["with_problems"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
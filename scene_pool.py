@@ -0,0 +1,54 @@
+from collections import OrderedDict
+
+
+class ScenePool:
+    """
+    Escenas ya construidas de las páginas vecinas a la actual.
+    Cambiar a una página que está en el pool es solo cambiar la escena de la vista,
+    sin volver a crear sus items desde los diccionarios.
+    """
+
+    def __init__(self, size=3):
+        self.size = size  # Escenas vivas en total, contando la de la página actual
+        self.entries = OrderedDict()  # índice de página -> (escena, capas)
+
+    def radius(self):
+        return max(1, (self.size - 1) // 2)
+
+    def __contains__(self, page_index):
+        return page_index in self.entries
+
+    def put(self, page_index, scene, capas):
+        self.entries[page_index] = (scene, capas)
+
+    def take(self, page_index):
+        """Saca la escena de la página (pasa a ser la actual). None si no estaba."""
+        return self.entries.pop(page_index, None)
+
+    def wanted(self, current_index, page_count):
+        """Páginas vecinas que conviene tener construidas, de la más cercana a la más lejana."""
+        if self.size <= 1:
+            return []
+        result = []
+        for d in range(1, self.radius() + 1):
+            for i in (current_index + d, current_index - d):
+                if 0 <= i < page_count:
+                    result.append(i)
+        return result[:self.size - 1]
+
+    def evict_outside(self, current_index, page_count):
+        """Descarta las escenas que quedaron fuera del rango de la página actual."""
+        keep = set(self.wanted(current_index, page_count))
+        for page_index in list(self.entries):
+            if page_index not in keep:
+                self._discard(self.entries.pop(page_index)[0])
+
+    def clear(self):
+        for scene, _capas in self.entries.values():
+            self._discard(scene)
+        self.entries.clear()
+
+    @staticmethod
+    def _discard(scene):
+        scene.clear()
+        scene.deleteLater()
@@ -0,0 +1,242 @@
+import os
+import sqlite3
+
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+import storage
+from serializers import page_layers
+
+# Índice de búsqueda de los textos de todas las clases, en ROOT_DIR/.indice/ (SQLite FTS5; en una
+# carpeta oculta para que sus escrituras no disparen el vigilante del catálogo).
+# Una fila por página con el contenido de sus items "text"; la tabla `pages` guarda de qué
+# clase es, su número y el mtime/tamaño del archivo de la página cuando se indexó. Al guardar
+# se reindexan solo las páginas escritas (con los datos que ya están en memoria); al abrir la
+# aplicación se revisan los archivos de páginas y se indexan los que cambiaron por fuera.
+# Las búsquedas no abren ningún cuaderno: todo sale de la base.
+
+INDEX_DIR_NAME = ".indice"
+INDEX_NAME = "busqueda.sqlite"
+MAX_RESULTS = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    project TEXT NOT NULL,
+    page_id TEXT NOT NULL,
+    page_no INTEGER NOT NULL,
+    mtime INTEGER NOT NULL DEFAULT 0,
+    size INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (project, page_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS texts USING fts5(content, tokenize = 'unicode61 remove_diacritics 2');
+"""
+
+
+def index_path(root):
+    return os.path.join(root, INDEX_DIR_NAME, INDEX_NAME)
+
+
+def connect(root):
+    """Conexión al índice (crea las tablas si hace falta). Una por hilo."""
+    os.makedirs(os.path.join(root, INDEX_DIR_NAME), exist_ok=True)
+    db = sqlite3.connect(index_path(root), timeout=10)
+    db.execute("PRAGMA journal_mode=WAL")  # Las búsquedas no esperan a una indexación en curso
+    db.executescript(_SCHEMA)
+    return db
+
+
+def page_text(page_data):
+    """Texto buscable de una página: el contenido de sus items de texto, uno por línea."""
+    return "\n".join(item["content"] for layer in page_layers(page_data)
+                     for item in layer.get("items", [])
+                     if item.get("type") == "text" and item.get("content"))
+
+
+def _file_stamp(project_dir, page_id):
+    try:
+        st = os.stat(storage.page_path(project_dir, page_id))
+    except OSError:
+        return 0, 0
+    return st.st_mtime_ns, st.st_size
+
+
+def index_pages(db, root, project_dir, pages, page_ids=None):
+    """
+    Reindexa `pages` ([(id, datos de página o blob)]) de una clase. Si se pasa `page_ids`
+    (la lista completa, en orden) se renumeran las páginas y se borran las que ya no están.
+    """
+    project = os.path.relpath(project_dir, root)
+    with db:
+        if page_ids is not None:
+            rows = db.execute("SELECT id, page_id FROM pages WHERE project = ?", (project,)).fetchall()
+            wanted = set(page_ids)
+            gone = [(rowid,) for rowid, pid in rows if pid not in wanted]
+            db.executemany("DELETE FROM texts WHERE rowid = ?", gone)
+            db.executemany("DELETE FROM pages WHERE id = ?", gone)
+            db.executemany("UPDATE pages SET page_no = ? WHERE project = ? AND page_id = ?",
+                           [(no, project, pid) for no, pid in enumerate(page_ids)])
+            numbers = {pid: no for no, pid in enumerate(page_ids)}
+        else:
+            numbers = {}
+
+        for pid, data in pages:
+            if isinstance(data, bytes):
+                data = storage.decode_page(data)
+            mtime, size = _file_stamp(project_dir, pid)
+            row = db.execute("SELECT id, page_no FROM pages WHERE project = ? AND page_id = ?",
+                             (project, pid)).fetchone()
+            if row is None:
+                rowid = db.execute("INSERT INTO pages (project, page_id, page_no, mtime, size) VALUES (?, ?, ?, ?, ?)",
+                                   (project, pid, numbers.get(pid, 0), mtime, size)).lastrowid
+            else:
+                rowid = row[0]
+                db.execute("UPDATE pages SET mtime = ?, size = ? WHERE id = ?", (mtime, size, rowid))
+                db.execute("DELETE FROM texts WHERE rowid = ?", (rowid,))
+            text = page_text(data)
+            if text:
+                db.execute("INSERT INTO texts (rowid, content) VALUES (?, ?)", (rowid, text))
+
+
+def remove_project(db, root, project_dir):
+    project = os.path.relpath(project_dir, root)
+    with db:
+        gone = db.execute("SELECT id FROM pages WHERE project = ?", (project,)).fetchall()
+        db.executemany("DELETE FROM texts WHERE rowid = ?", gone)
+        db.execute("DELETE FROM pages WHERE project = ?", (project,))
+
+
+def sync_project(db, root, project_dir):
+    """Indexa las páginas de una clase cuyo archivo cambió desde la última vez (solo contenedores actuales)."""
+    try:
+        notebook = storage.NotebookFile(storage.container_path(project_dir))
+    except (OSError, storage.ContainerError):
+        return 0
+    if notebook.version != storage.CONTAINER_VERSION:
+        return 0  # Se migra (y se indexa al guardarse) la próxima vez que se abra
+
+    page_ids = notebook.page_ids()
+    project = os.path.relpath(project_dir, root)
+    stamps = {pid: (mtime, size) for pid, mtime, size in
+              db.execute("SELECT page_id, mtime, size FROM pages WHERE project = ?", (project,))}
+    pages = []
+    for pid in page_ids:
+        stamp = _file_stamp(project_dir, pid)
+        if stamp != (0, 0) and stamps.get(pid) != stamp:
+            try:
+                pages.append((pid, storage.read_page_file(project_dir, pid)))
+            except Exception as e:
+                print(f"búsqueda {project_dir}: {e}")
+    if pages or set(stamps) != set(page_ids):
+        index_pages(db, root, project_dir, pages, page_ids)
+    return len(pages)
+
+
+def sync_all(db, root, projects, materias=None):
+    """
+    Pone al día el índice con la lista de clases existentes y olvida las que ya no están
+    (de todas, o solo dentro de `materias` si se pasa: el resto no se revisó).
+    """
+    wanted = {os.path.relpath(p, root) for p in projects}
+    for (project,) in db.execute("SELECT DISTINCT project FROM pages").fetchall():
+        in_scope = materias is None or os.path.dirname(project) in materias
+        if in_scope and project not in wanted:
+            remove_project(db, root, os.path.join(root, project))
+    return sum(sync_project(db, root, p) for p in projects)
+
+
+def _fts_query(text):
+    """Cada palabra como prefijo entre comillas (sin operadores FTS: lo que escribe el usuario es texto)."""
+    words = text.replace('"', " ").split()
+    return " ".join(f'"{w}"*' for w in words)
+
+
+def search(db, text, limit=MAX_RESULTS):
+    """[(proyecto relativo a ROOT_DIR, id de página, nº de página, fragmento)] de las mejores coincidencias."""
+    query = _fts_query(text)
+    if not query:
+        return []
+    return db.execute(
+        "SELECT p.project, p.page_id, p.page_no, snippet(texts, 0, '«', '»', '…', 10) "
+        "FROM texts JOIN pages p ON p.id = texts.rowid WHERE texts MATCH ? ORDER BY rank LIMIT ?",
+        (query, limit)).fetchall()
+
+
+# --- INDEXACIÓN EN SEGUNDO PLANO ---
+
+class IndexTask(QRunnable):
+    def __init__(self, root, work, done_signal):
+        super().__init__()
+        self.root = root
+        self.work = work  # Función (db, root) -> None
+        self.done_signal = done_signal
+
+    def run(self):
+        try:
+            db = connect(self.root)
+            try:
+                self.work(db, self.root)
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"búsqueda: {e}")
+        self.done_signal.emit()
+
+
+class SearchIndexService(QObject):
+    """
+    Escribe el índice de a una tarea por vez en un hilo aparte; las búsquedas usan su propia
+    conexión en el hilo de la GUI. Sin FTS5 en el sqlite3 de Python queda deshabilitado.
+    """
+    updated = pyqtSignal()
+    _task_done = pyqtSignal()
+
+    def __init__(self, root, parent=None):
+        super().__init__(parent)
+        self.root = root
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        try:
+            self.db = connect(root)
+        except (sqlite3.Error, OSError) as e:
+            print(f"búsqueda deshabilitada: {e}")
+            self.db = None
+        self._task_done.connect(self.updated)
+
+    @property
+    def enabled(self):
+        return self.db is not None
+
+    def is_empty(self):
+        return not self.enabled or self.db.execute("SELECT 1 FROM pages LIMIT 1").fetchone() is None
+
+    def _run(self, work):
+        if self.enabled:
+            self.pool.start(IndexTask(self.root, work, self._task_done))
+
+    def pages_saved(self, project_dir, pages, page_ids=None):
+        """Un guardado escribió esas páginas (los datos no se modifican después: se leen en el hilo)."""
+        self._run(lambda db, root: index_pages(db, root, project_dir, pages, page_ids))
+
+    def project_removed(self, project_dir):
+        self._run(lambda db, root: remove_project(db, root, project_dir))
+
+    def sync(self, projects, materias=None):
+        """Revisa en segundo plano esas clases (ver sync_all)."""
+        projects = list(projects)
+        self._run(lambda db, root: sync_all(db, root, projects, materias))
+
+    def search(self, text):
+        if not self.enabled:
+            return []
+        try:
+            return search(self.db, text)
+        except sqlite3.Error as e:
+            print(f"búsqueda: {e}")
+            return []
+
+    def stop(self):
+        self.pool.clear()
+        self.pool.waitForDone()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
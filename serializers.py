@@ -1,19 +1,233 @@
 import os
-import shutil
-from PyQt6.QtCore import Qt
-from PyQt6.QtGui import QPainterPath, QPen, QColor, QBrush, QFont, QTransform, QPixmap
+import sys
+import uuid
+import base64
+from array import array
+
+from PyQt6.QtCore import Qt, QSize
+from PyQt6.QtGui import QPainterPath, QPen, QColor, QBrush, QFont, QTransform
 from PyQt6.QtWidgets import QGraphicsPathItem, QGraphicsTextItem, QGraphicsPixmapItem, QGraphicsItem
 
-from custom_items import EditableTextItem
+from custom_items import EditableTextItem, StrokeItem, ImageProxyItem
+import image_assets
+from data_models import CapaData
+from spatial_index import scene_index
+
+
+# --- CODIFICACIÓN EMPAQUETADA DE GEOMETRÍA ---
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def pack_path(path):
+    """
+    Empaqueta los elementos de un QPainterPath en arrays planos:
+    't' -> tipos de elemento (uint8), 'xy' -> coordenadas intercaladas (float32 little-endian).
+    """
+    n = path.elementCount()
+    tipos = bytearray(n)
+    coords = array("f", bytes(8 * n))
+    for k in range(n):
+        e = path.elementAt(k)
+        tipos[k] = e.type.value
+        coords[2 * k] = e.x
+        coords[2 * k + 1] = e.y
+    if sys.byteorder == "big":
+        coords.byteswap()
+    return {"t": _b64(bytes(tipos)), "xy": _b64(coords.tobytes())}
+
+
+def unpack_path(geom):
+    """Inverso de pack_path: devuelve (tipos, coords) como secuencias planas."""
+    tipos = base64.b64decode(geom["t"])
+    coords = array("f")
+    coords.frombytes(base64.b64decode(geom["xy"]))
+    if sys.byteorder == "big":
+        coords.byteswap()
+    return tipos, coords
+
+
+def _build_path(tipos, coords):
+    """Reconstruye un QPainterPath a partir de tipos y coordenadas intercaladas."""
+    path = QPainterPath()
+    n = len(tipos)
+    if not n:
+        return path
+    path.moveTo(coords[0], coords[1])
+    i = 1
+    while i < n:
+        t = tipos[i]
+        if t == 1:
+            path.lineTo(coords[2 * i], coords[2 * i + 1]); i += 1
+        elif t == 2:
+            if i + 2 < n:
+                path.cubicTo(coords[2 * i], coords[2 * i + 1], coords[2 * i + 2], coords[2 * i + 3],
+                             coords[2 * i + 4], coords[2 * i + 5])
+                i += 3
+            else:
+                i += 1
+        else:
+            path.moveTo(coords[2 * i], coords[2 * i + 1]); i += 1
+    return path
+
+
+def decode_path(item_data):
+    """Devuelve el QPainterPath de un item 'path', en formato empaquetado o en el antiguo (lista de dicts)."""
+    geom = item_data.get("geom")
+    if geom is not None:
+        return _build_path(*unpack_path(geom))
+
+    elems = item_data.get("path_elements", [])
+    tipos = [e["t"] for e in elems]
+    coords = []
+    for e in elems:
+        coords.append(e["x"])
+        coords.append(e["y"])
+    return _build_path(tipos, coords)
+
+
+def page_layers(page_data):
+    """Devuelve la lista de capas de una página (dict con paleta o lista antigua de capas)."""
+    if isinstance(page_data, dict):
+        return page_data.get("layers", [])
+    return page_data or []
+
+
+def page_palette(page_data):
+    if isinstance(page_data, dict):
+        return page_data.get("palette", [])
+    return []
+
+
+def item_pen(item_data, palette):
+    """Resuelve (color, grosor) del lápiz de un item 'path' usando la paleta si corresponde."""
+    if "pen" in item_data:
+        color, width = palette[item_data["pen"]]
+        return color, width
+    return item_data.get("pen_color", "#000000"), item_data.get("pen_width", 1)
+
+
+def item_uid(item):
+    """Id estable del item dentro de su página (lo usa el journal para referirse a él)."""
+    uid = getattr(item, "_uid", None)
+    if not uid:
+        uid = item._uid = uuid.uuid4().hex[:16]
+    return uid
+
+
+def implicit_item_id(layer_index, item_index):
+    """Id de los items guardados antes de que existieran ids: se deriva de su posición en la página."""
+    return f"{layer_index}.{item_index}"
+
+
+def invalidate_item(item):
+    """
+    Descarta la forma serializada en caché de un item. La llaman los comandos de deshacer
+    y los items editables cuando cambia el contenido (geometría, estilo, texto).
+    """
+    item._ser_cache = None
+
+
+def _serialize_body(item):
+    """
+    Parte del item que no depende de la pose: tipo, geometría y estilo.
+    Devuelve (body, pen_key) o None si el item no se guarda. Se cachea en el propio item
+    hasta que invalidate_item() la descarta, así una página sin cambios no vuelve a
+    recorrer los elementos de cada path. No toca el disco.
+    """
+    cache = getattr(item, "_ser_cache", None)
+    if cache is not None:
+        return cache
+
+    body = {}
+    pen_key = None
+    cacheable = True
+
+    if isinstance(item, QGraphicsPathItem):
+        body["type"] = "path"
+        path = item.path()
+        if not path: return None
+
+        body["geom"] = pack_path(path)
+        pen_key = (item.pen().color().name(), item.pen().width())
+        body["has_pen"] = item.pen().style() != Qt.PenStyle.NoPen
+        body["has_fill"] = item.brush().style() != Qt.BrushStyle.NoBrush
+        if body["has_fill"]:
+            body["fill_color"] = item.brush().color().name()
+
+    elif isinstance(item, (EditableTextItem, QGraphicsTextItem)):
+        body["type"] = "text"
+        body["content"] = item.toPlainText()
+        body["font_family"] = item.font().family()
+        body["font_size"] = item.font().pointSize()
+        body["color"] = item.defaultTextColor().name()
+        # Solo EditableTextItem avisa cuando cambia su texto
+        cacheable = isinstance(item, EditableTextItem)
+
+    elif isinstance(item, QGraphicsPixmapItem):
+        body["type"] = "image"
+        # Lógica de imagen...
+        # Nombre del archivo en assets/: el hash del contenido (lo fija insertar_imagen_path,
+        # que también encarga la copia) o el nombre con el que se guardó en versiones anteriores
+        body["img_filename"] = item.data(Qt.ItemDataRole.UserRole + 2)
+        size = getattr(item, "image_size", None)
+        if size is not None:
+            body["img_w"], body["img_h"] = size.width(), size.height()
+            # Una imagen recién insertada sale con todos sus niveles en el guardado que la copia
+            inserted = item.data(Qt.ItemDataRole.UserRole + 1)
+            body["mips"] = image_assets.mip_count(size.width(), size.height()) if inserted else item.mips
+
+    if cacheable:
+        item._ser_cache = (body, pen_key)
+    return body, pen_key
+
+
+def serialize_pose(item):
+    pos = item.pos()
+    trans = item.transform()
+    return {
+        "id": item_uid(item),
+        "pos_x": pos.x(),
+        "pos_y": pos.y(),
+        "rot": item.rotation(),
+        "scale": item.scale(),
+        "z": item.zValue(),
+        "m11": trans.m11(), "m12": trans.m12(), "m21": trans.m21(), "m22": trans.m22()
+    }
+
+
+def serialize_item(main_window, item):
+    """
+    Serializa un único item sin paleta (color y grosor del lápiz van explícitos).
+    Devuelve None si el item no se guarda.
+    """
+    serialized = _serialize_body(item)
+    if serialized is None:
+        return None
+    body, pen_key = serialized
+    item_data = serialize_pose(item)
+    item_data.update(body)
+    if pen_key is not None:
+        item_data["pen_color"], item_data["pen_width"] = pen_key
+    return item_data
+
 
 def serialize_current_scene(main_window):
-    """Convierte las capas y items de la escena actual a una lista de diccionarios."""
+    """
+    Convierte las capas y items de la escena actual a un diccionario de página:
+    {"palette": [[color, grosor], ...], "layers": [...]}
+    """
+    return serialize_capas(main_window.scene, main_window.capas)
+
+
+def serialize_capas(scene, capas):
+    """Como serialize_current_scene, para capas de cualquier escena (p. ej. una de build_page_scene)."""
     serialized_layers = []
-    assets_dir = os.path.join(main_window.current_project_dir, "assets") if main_window.current_project_dir else ""
-    if assets_dir and not os.path.exists(assets_dir):
-        os.makedirs(assets_dir, exist_ok=True)
+    palette = []
+    palette_index = {}
 
-    for capa in main_window.capas:
+    for capa in capas:
         layer_data = {
             "nombre": capa.nombre,
             "visible": capa.visible,
@@ -22,111 +236,73 @@ def serialize_current_scene(main_window):
 
         for item in capa.items:
             try:
-                if item.scene() != main_window.scene: continue
-
-                item_data = {
-                    "pos_x": item.pos().x(),
-                    "pos_y": item.pos().y(),
-                    "rot": item.rotation(),
-                    "scale": item.scale(),
-                    "z": item.zValue()
-                }
-
-                # Transform matrix
-                trans = item.transform()
-                item_data.update({"m11": trans.m11(), "m12": trans.m12(), "m21": trans.m21(), "m22": trans.m22()})
-
-                if isinstance(item, QGraphicsPathItem):
-                    item_data["type"] = "path"
-                    path = item.path()
-                    if not path: continue
-
-                    elements = []
-                    for k in range(path.elementCount()):
-                        e = path.elementAt(k)
-                        elements.append({"t": e.type.value, "x": float(e.x), "y": float(e.y)})
-                    item_data["path_elements"] = elements
-                    item_data["pen_color"] = item.pen().color().name()
-                    item_data["pen_width"] = item.pen().width()
-                    item_data["has_pen"] = item.pen().style() != Qt.PenStyle.NoPen
-                    item_data["has_fill"] = item.brush().style() != Qt.BrushStyle.NoBrush
-                    if item_data["has_fill"]:
-                        item_data["fill_color"] = item.brush().color().name()
-
-                elif isinstance(item, (EditableTextItem, QGraphicsTextItem)):
-                    item_data["type"] = "text"
-                    item_data["content"] = item.toPlainText()
-                    item_data["font_family"] = item.font().family()
-                    item_data["font_size"] = item.font().pointSize()
-                    item_data["color"] = item.defaultTextColor().name()
-
-                elif isinstance(item, QGraphicsPixmapItem):
-                    item_data["type"] = "image"
-                    # Lógica de imagen...
-                    original_path = item.data(Qt.ItemDataRole.UserRole + 1)
-                    filename = item.data(Qt.ItemDataRole.UserRole + 2)  # Filename guardado previamente
-
-                    if original_path and assets_dir:
-                        filename = os.path.basename(original_path)
-                        dest = os.path.join(assets_dir, filename)
-                        if not os.path.exists(dest):
-                            try:
-                                shutil.copy2(original_path, dest)
-                            except:
-                                pass
-
-                    item_data["img_filename"] = filename
+                if item.scene() != scene: continue
+
+                serialized = _serialize_body(item)
+                if serialized is None: continue
+                body, pen_key = serialized
+
+                # La pose se lee siempre: es barata y cubre movimientos que no pasan por un comando
+                item_data = serialize_pose(item)
+                item_data.update(body)
+
+                if pen_key is not None:
+                    if pen_key not in palette_index:
+                        palette_index[pen_key] = len(palette)
+                        palette.append(list(pen_key))
+                    item_data["pen"] = palette_index[pen_key]
 
                 layer_data["items"].append(item_data)
             except RuntimeError:
                 continue
 
         serialized_layers.append(layer_data)
-    return serialized_layers
+    return {"palette": palette, "layers": serialized_layers}
 
 
 def render_layers_to_scene(main_window, layers_data):
-    """Reconstruye los objetos gráficos en la escena a partir de una lista de datos de capas."""
+    """
+    Reconstruye los objetos gráficos en la escena a partir de los datos de una página.
+    Acepta el diccionario de página (con paleta) o la lista antigua de capas.
+    """
     assets_dir = os.path.join(main_window.current_project_dir, "assets") if main_window.current_project_dir else ""
+    main_window.set_capas(build_page_scene(main_window.scene, layers_data, assets_dir))
+
+
+def build_page_scene(scene, layers_data, assets_dir):
+    """
+    Crea los items de una página en `scene` sin tocar la interfaz y devuelve sus capas
+    (índice 0 = capa superior). El z de cada contenedor de capa lo asigna quien la muestre
+    (actualizar_z_values); el de los items es su orden dentro de la capa.
+    """
+    palette = page_palette(layers_data)
+    layers_data = page_layers(layers_data)
 
     # Si no hay capas, crear una por defecto
     if not layers_data:
-        main_window.add_layer("Capa 1")
-        return
+        capa = CapaData("Capa 1")
+        scene.addItem(capa.container)
+        return [capa]
 
-    for layer_data in reversed(layers_data):
-        main_window.add_layer(layer_data["nombre"])
-        current_capa = main_window.capas[0]
+    capas = []
+    index = scene_index(scene)
+    for layer_index in reversed(range(len(layers_data))):
+        layer_data = layers_data[layer_index]
+        current_capa = CapaData(layer_data.get("nombre", f"Capa {layer_index + 1}"))
+        capas.insert(0, current_capa)
         current_capa.visible = layer_data.get("visible", True)
+        scene.addItem(current_capa.container)
 
-        for item_data in layer_data.get("items", []):
+        for item_index, item_data in enumerate(layer_data.get("items", [])):
             new_item = None
             type_str = item_data["type"]
 
             if type_str == "path":
-                path = QPainterPath()
-                elems = item_data.get("path_elements", [])
-                if elems:
-                    path.moveTo(elems[0]["x"], elems[0]["y"])
-                    i = 1
-                    while i < len(elems):
-                        e = elems[i]
-                        if e["t"] == 1:
-                            path.lineTo(e["x"], e["y"]); i += 1
-                        elif e["t"] == 2:
-                            if i + 2 < len(elems):
-                                path.cubicTo(elems[i]["x"], elems[i]["y"], elems[i + 1]["x"], elems[i + 1]["y"],
-                                             elems[i + 2]["x"], elems[i + 2]["y"])
-                                i += 3
-                            else:
-                                i += 1
-                        else:
-                            path.moveTo(e["x"], e["y"]); i += 1
-
-                new_item = QGraphicsPathItem(path)
+                new_item = StrokeItem(decode_path(item_data))
                 if item_data.get("has_pen", True):
-                    pen = QPen(QColor(item_data["pen_color"]))
-                    pen.setWidth(item_data.get("pen_width", 1))
+                    pen_color, pen_width = item_pen(item_data, palette)
+                    pen = QPen(QColor(pen_color))
+                    pen.setWidth(pen_width)
                     pen.setCapStyle(Qt.PenCapStyle.RoundCap)
                     pen.setJoinStyle(Qt.PenJoinStyle.RoundJoin)
                     new_item.setPen(pen)
@@ -145,24 +321,30 @@ def render_layers_to_scene(main_window, layers_data):
                 fname = item_data.get("img_filename")
                 if fname and assets_dir:
                     ipath = os.path.join(assets_dir, fname)
-                    if os.path.exists(ipath):
-                        new_item = QGraphicsPixmapItem(QPixmap(ipath))
+                    if "img_w" in item_data:
+                        size = QSize(item_data["img_w"], item_data["img_h"])
+                    else:
+                        size = image_assets.image_size(ipath)  # Páginas viejas: solo la cabecera
+                    if size.isValid():
+                        # Nada se lee acá: el item pide en segundo plano el nivel que necesita su zoom
+                        # y mientras tanto ocupa su lugar con el tamaño correcto
+                        new_item = ImageProxyItem(ipath, size, item_data.get("mips", 0))
                         new_item.setData(Qt.ItemDataRole.UserRole + 2, fname)
 
             if new_item:
+                new_item._uid = item_data.get("id") or implicit_item_id(layer_index, item_index)
                 new_item.setPos(item_data["pos_x"], item_data["pos_y"])
                 new_item.setRotation(item_data.get("rot", 0))
                 if "m11" in item_data:
                     new_item.setTransform(
                         QTransform(item_data["m11"], item_data["m12"], item_data["m21"], item_data["m22"], 0, 0))
-                else:
-                    new_item.setScale(item_data.get("scale", 1))
+                # La escala va aparte de la transformación (p. ej. la que pone insertar_imagen_path)
+                new_item.setScale(item_data.get("scale", 1))
 
-                new_item.setZValue(item_data.get("z", 0))
                 new_item.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)
                 new_item.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
-                main_window.scene.addItem(new_item)
-                current_capa.items.append(new_item)
-                new_item.setVisible(current_capa.visible)
+                current_capa.add_item(new_item)
+                if index is not None:
+                    index.insert(new_item)
 
-    main_window.actualizar_z_values()
\ No newline at end of file
+    return capas
\ No newline at end of file
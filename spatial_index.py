@@ -0,0 +1,288 @@
+import math
+from array import array
+
+from PyQt6.QtCore import Qt, QRectF
+from PyQt6.QtWidgets import QGraphicsPathItem
+
+# Índice espacial de una página para borrar y seleccionar sin recorrer todos los trazos.
+# Grilla uniforme: cada celda guarda los trazos con algún segmento (en coordenadas de escena,
+# ensanchado por el medio grosor del lápiz) que la toca. Las consultas juntan candidatos de
+# las celdas y recién ahí prueban la geometría exacta de sus segmentos.
+#
+# Los comandos del undo (undo_commands) lo mantienen al día; los trazos nuevos o movidos se
+# aplanan en segmentos recién en la próxima consulta, así cargar una página o agregar un
+# trazo no cuesta nada extra. Textos e imágenes son pocos: se prueban con su caja actual.
+
+CELL_SIZE = 16.0
+CHUNK = 4  # Segmentos consecutivos que se registran en la grilla con una sola caja
+
+
+def scene_index(scene):
+    """Índice espacial de la escena (None si no tiene, p. ej. una QGraphicsScene suelta)."""
+    return getattr(scene, "spatial_index", None)
+
+
+def _boxes_touch(a, b):
+    """
+    Como QRectF.intersects, pero con bordes incluidos y sin descartar rectángulos vacíos:
+    la consulta de un punto (items_at con radio 0) es un rectángulo de tamaño 0.
+    """
+    return a.left() <= b.right() and b.left() <= a.right() and a.top() <= b.bottom() and b.top() <= a.bottom()
+
+
+def _point_segment_dist2(px, py, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        t = 0.0
+    else:
+        t = max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / length2))
+    cx, cy = x1 + t * dx - px, y1 + t * dy - py
+    return cx * cx + cy * cy
+
+
+def _segments_cross(ax, ay, bx, by, cx, cy, dx, dy):
+    def orient(px, py, qx, qy, rx, ry):
+        return (qx - px) * (ry - py) - (qy - py) * (rx - px)
+
+    d1 = orient(cx, cy, dx, dy, ax, ay)
+    d2 = orient(cx, cy, dx, dy, bx, by)
+    d3 = orient(ax, ay, bx, by, cx, cy)
+    d4 = orient(ax, ay, bx, by, dx, dy)
+    return ((d1 > 0) != (d2 > 0)) and ((d3 > 0) != (d4 > 0))
+
+
+def _segments_within(ax, ay, bx, by, cx, cy, dx, dy, limit2):
+    """¿Los segmentos AB y CD pasan a distancia² <= limit2? (sale apenas encuentra un extremo cerca)"""
+    return (_point_segment_dist2(cx, cy, ax, ay, bx, by) <= limit2
+            or _point_segment_dist2(dx, dy, ax, ay, bx, by) <= limit2
+            or _point_segment_dist2(ax, ay, cx, cy, dx, dy) <= limit2
+            or _point_segment_dist2(bx, by, cx, cy, dx, dy) <= limit2
+            or _segments_cross(ax, ay, bx, by, cx, cy, dx, dy))
+
+
+def _segment_hits_rect(x1, y1, x2, y2, left, top, right, bottom):
+    """Liang-Barsky: ¿el segmento tiene algún punto dentro del rectángulo?"""
+    t0, t1 = 0.0, 1.0
+    dx, dy = x2 - x1, y2 - y1
+    for p, q in ((-dx, x1 - left), (dx, right - x1), (-dy, y1 - top), (dy, bottom - y1)):
+        if p == 0:
+            if q < 0:
+                return False
+        else:
+            t = q / p
+            if p < 0:
+                t0 = max(t0, t)
+            else:
+                t1 = min(t1, t)
+            if t0 > t1:
+                return False
+    return True
+
+
+def _iter_segments(chunks, wanted=None):
+    """(índice, x1, y1, x2, y2) de los segmentos de los tramos `wanted` (todos si es None)."""
+    for k in (range(len(chunks)) if wanted is None else sorted(wanted)):
+        first, points = chunks[k]
+        for i in range(0, len(points) - 2, 2):
+            yield first + i // 2, points[i], points[i + 1], points[i + 2], points[i + 3]
+
+
+class SpatialIndex:
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}  # (columna, fila) -> {trazo: [tramos que tocan la celda]}
+        self.item_cells = {}  # trazo -> celdas que ocupa
+        # trazo -> [(índice de su primer segmento, array('d') [x0, y0, x1, y1, ...])], en la escena.
+        # Cada tramo tiene hasta CHUNK segmentos; los segmentos se numeran en el orden del
+        # trazo aplanado (toSubpathPolygons), a través de los subtrazos.
+        self.chunks = {}
+        self.margins = {}  # trazo -> medio grosor del lápiz en la escena
+        self.pending = set()  # trazos agregados o movidos que aún no se aplanaron
+        self.others = set()  # textos, imágenes, etc.
+
+    # --- MANTENIMIENTO ---
+
+    def insert(self, item):
+        if isinstance(item, QGraphicsPathItem):
+            self._drop(item)
+            self.pending.add(item)
+        else:
+            self.others.add(item)
+
+    def update(self, item):
+        """El item cambió de forma o de transformación."""
+        self.insert(item)
+
+    def remove(self, item):
+        self.pending.discard(item)
+        self.others.discard(item)
+        self._drop(item)
+
+    def clear(self):
+        self.cells.clear()
+        self.item_cells.clear()
+        self.chunks.clear()
+        self.margins.clear()
+        self.pending.clear()
+        self.others.clear()
+
+    def _drop(self, item):
+        for cell in self.item_cells.pop(item, ()):
+            entries = self.cells[cell]
+            del entries[item]
+            if not entries:
+                del self.cells[cell]
+        self.chunks.pop(item, None)
+        self.margins.pop(item, None)
+
+    def _flush(self):
+        while self.pending:
+            self._index(self.pending.pop())
+
+    def _index(self, item):
+        if item.scene() is None:
+            return
+        transform = item.sceneTransform()
+        pen = item.pen()
+        scale = math.sqrt(abs(transform.determinant())) or 1.0
+        margin = (pen.widthF() / 2 * scale) if pen.style() != Qt.PenStyle.NoPen else 0.0
+
+        chunks = []
+        first = 0
+        for poly in item.path().toSubpathPolygons(transform):
+            # Copia directa de los QPointF (dos doubles cada uno) sin pasar punto por punto
+            ptr = poly.data()
+            ptr.setsize(len(poly) * 16)
+            points = array("d", ptr.asstring())
+            if len(points) == 2:
+                points.extend(points)  # Un punto suelto es un segmento de largo 0
+            for i in range(0, len(points) - 2, 2 * CHUNK):
+                chunk = points[i:i + 2 * CHUNK + 2]  # Los tramos comparten el punto del borde
+                chunks.append((first, chunk))
+                first += len(chunk) // 2 - 1
+
+        cells = set()
+        size = self.cell_size
+        for k, (_first, points) in enumerate(chunks):
+            xs, ys = points[0::2], points[1::2]
+            for cx in range(int((min(xs) - margin) // size), int((max(xs) + margin) // size) + 1):
+                for cy in range(int((min(ys) - margin) // size), int((max(ys) + margin) // size) + 1):
+                    self.cells.setdefault((cx, cy), {}).setdefault(item, []).append(k)
+                    cells.add((cx, cy))
+        self.item_cells[item] = cells
+        self.chunks[item] = chunks
+        self.margins[item] = margin
+
+    # --- CONSULTAS ---
+
+    @staticmethod
+    def _usable(item, editable_only):
+        if item.scene() is None:
+            return False
+        return not editable_only or (item.isVisible() and item.isEnabled())
+
+    def _rect_cells(self, rect):
+        size = self.cell_size
+        return [(cx, cy) for cx in range(int(rect.left() // size), int(rect.right() // size) + 1)
+                for cy in range(int(rect.top() // size), int(rect.bottom() // size) + 1)]
+
+    def _sweep_cells(self, ax, ay, bx, by, radius):
+        """Celdas a menos de `radius` del segmento (no toda su caja: importa en barridos diagonales)."""
+        size = self.cell_size
+        reach2 = (radius + size * 0.7072) ** 2  # Radio + media diagonal de la celda
+        rect = QRectF(min(ax, bx) - radius, min(ay, by) - radius, abs(bx - ax) + 2 * radius, abs(by - ay) + 2 * radius)
+        return [(cx, cy) for cx, cy in self._rect_cells(rect)
+                if _point_segment_dist2((cx + 0.5) * size, (cy + 0.5) * size, ax, ay, bx, by) <= reach2]
+
+    def _candidates(self, rect, editable_only, cells=None):
+        """{item: tramos candidatos} (None para textos e imágenes, que se prueban con su caja)."""
+        self._flush()
+        found = {}
+        for cell in (cells if cells is not None else self._rect_cells(rect)):
+            for item, ks in self.cells.get(cell, {}).items():
+                found.setdefault(item, set()).update(ks)
+        for item in self.others:
+            if item.scene() is None or _boxes_touch(item.sceneBoundingRect(), rect):
+                found[item] = None
+
+        result = {}
+        for item, ks in found.items():
+            if item.scene() is None:
+                self.remove(item)  # Se fue con su capa (eliminar_capa): se purga acá
+            elif self._usable(item, editable_only):
+                result[item] = ks
+        return result
+
+    def candidates(self, rect, editable_only=True):
+        """Items que pueden tocar `rect` según la grilla (trazos) o su caja actual (otros). Sin prueba exacta."""
+        return list(self._candidates(rect, editable_only))
+
+    def items_at(self, point, radius=0.0, editable_only=True):
+        """Items que pasan a menos de `radius` del punto (picking)."""
+        px, py = point.x(), point.y()
+        rect = QRectF(px - radius, py - radius, 2 * radius, 2 * radius)
+        result = []
+        for item, ks in self._candidates(rect, editable_only).items():
+            if ks is None:
+                if item.sceneBoundingRect().adjusted(-radius, -radius, radius, radius).contains(point):
+                    result.append(item)
+                continue
+            limit2 = (radius + self.margins[item]) ** 2
+            if any(_point_segment_dist2(px, py, x1, y1, x2, y2) <= limit2
+                   for _i, x1, y1, x2, y2 in _iter_segments(self.chunks[item], ks)):
+                result.append(item)
+        return result
+
+    def items_in_rect(self, rect, contained=False, editable_only=True):
+        """Selección por rectángulo: trazos que lo tocan (o que caben enteros si `contained`)."""
+        left, top, right, bottom = rect.left(), rect.top(), rect.right(), rect.bottom()
+        result = []
+        for item, ks in self._candidates(rect, editable_only).items():
+            if ks is None:
+                box = item.sceneBoundingRect()
+                if rect.contains(box) if contained else rect.intersects(box):
+                    result.append(item)
+                continue
+            if contained:
+                if all(left <= min(points[0::2]) and max(points[0::2]) <= right and
+                       top <= min(points[1::2]) and max(points[1::2]) <= bottom
+                       for _first, points in self.chunks[item]):
+                    result.append(item)
+                continue
+            # El trazo toca el rectángulo si algún segmento entra en él ensanchado por el lápiz
+            m = self.margins[item]
+            if any(_segment_hits_rect(x1, y1, x2, y2, left - m, top - m, right + m, bottom + m)
+                   for _i, x1, y1, x2, y2 in _iter_segments(self.chunks[item], ks)):
+                result.append(item)
+        return result
+
+    def segments_hit(self, p1, p2, radius, editable_only=True):
+        """
+        Barrido de goma de p1 a p2 con radio `radius`.
+        Devuelve {trazo: [índices de segmento tocados]}; el índice i es el segmento i del
+        trazo aplanado (toSubpathPolygons en orden). Los otros items tocados van con [].
+        """
+        ax, ay, bx, by = p1.x(), p1.y(), p2.x(), p2.y()
+        rect = QRectF(min(ax, bx) - radius, min(ay, by) - radius,
+                      abs(bx - ax) + 2 * radius, abs(by - ay) + 2 * radius)
+        hits = {}
+        for item, ks in self._candidates(rect, editable_only, self._sweep_cells(ax, ay, bx, by, radius)).items():
+            if ks is None:
+                hits[item] = []
+                continue
+            limit = radius + self.margins[item]
+            limit2 = limit * limit
+            left, top = rect.left() - limit, rect.top() - limit
+            right, bottom = rect.right() + limit, rect.bottom() + limit
+            touched = []
+            for i, x1, y1, x2, y2 in _iter_segments(self.chunks[item], ks):
+                # Descarte rápido por caja antes de la distancia exacta
+                if (x1 < left and x2 < left) or (x1 > right and x2 > right) or \
+                        (y1 < top and y2 < top) or (y1 > bottom and y2 > bottom):
+                    continue
+                if _segments_within(ax, ay, bx, by, x1, y1, x2, y2, limit2):
+                    touched.append(i)
+            if touched:
+                hits[item] = touched
+        return hits
@@ -0,0 +1,427 @@
+import os
+import json
+import uuid
+import zlib
+import shutil
+import struct
+import stat
+import tempfile
+from collections import OrderedDict
+
+import image_assets
+
+# Formato del cuaderno en disco:
+#   notebook.vnb -> cabecera (magic, versión, flags, nº de páginas) + tabla de páginas
+#   pages/       -> un archivo por página (JSON comprimido con zlib)
+#
+# Versión 1 del contenedor: la tabla guarda (offset, longitud) y los blobs van dentro del mismo archivo.
+# Versión 2 (actual): la tabla guarda el id de cada página y el blob vive en pages/<id>.vnp,
+# así un guardado solo reescribe las páginas modificadas y el manifiesto (unos pocos bytes).
+
+CONTAINER_NAME = "notebook.vnb"
+PAGES_DIR_NAME = "pages"
+PAGE_EXT = ".vnp"
+LEGACY_JSON_NAME = "data.json"
+
+MAGIC = b"VNBK"
+CONTAINER_VERSION = 2
+_HEADER = struct.Struct("<4sHHI")  # magic, versión, flags, nº páginas
+_ENTRY_V1 = struct.Struct("<QI")  # offset, longitud del blob
+_ENTRY = struct.Struct("<16s")  # id de página (uuid)
+
+# Memoria máxima (aprox.) de páginas parseadas que se mantienen abiertas
+DEFAULT_CACHE_BUDGET = 64 * 1024 * 1024
+
+
+class ContainerError(Exception):
+    pass
+
+
+def container_path(project_dir):
+    return os.path.join(project_dir, CONTAINER_NAME)
+
+
+def page_path(project_dir, page_id):
+    return os.path.join(project_dir, PAGES_DIR_NAME, page_id + PAGE_EXT)
+
+
+def is_project(project_dir):
+    """Una carpeta es una clase si tiene contenedor binario o el data.json antiguo."""
+    return (os.path.exists(os.path.join(project_dir, CONTAINER_NAME)) or
+            os.path.exists(os.path.join(project_dir, LEGACY_JSON_NAME)))
+
+
+def new_page_id():
+    return uuid.uuid4().hex
+
+
+def encode_page(page_data):
+    return zlib.compress(json.dumps(page_data, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def decode_page(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def read_page_file(project_dir, page_id):
+    with open(page_path(project_dir, page_id), "rb") as f:
+        return decode_page(f.read())
+
+
+def estimate_page_size(page_data):
+    """
+    Estimación barata (sin volver a codificar) de la memoria que ocupa una página parseada.
+    Basta para repartir el presupuesto de la caché, no pretende ser exacta.
+    """
+    layers = page_data.get("layers", []) if isinstance(page_data, dict) else (page_data or [])
+    size = 256
+    for layer in layers:
+        for item in layer.get("items", []):
+            size += 512
+            geom = item.get("geom")
+            if geom:
+                size += len(geom["t"]) + len(geom["xy"])
+            else:
+                size += 200 * len(item.get("path_elements", ())) + len(item.get("content", ""))
+    return size
+
+
+def _fsync_dir(dir_path):
+    """Asegura que el rename quede en disco (solo POSIX; en Windows no se puede abrir un directorio)."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(dir_path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _current_umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+# Permisos de los archivos nuevos, como los dejaría open(): mkstemp los crea con 0600
+_NEW_FILE_MODE = 0o666 & ~_current_umask()
+
+
+def _atomic_write(path, write):
+    """
+    write(f) escribe a un temporal propio; se hace fsync y se reemplaza `path` de una vez con
+    os.replace: un corte a mitad de escritura deja el archivo anterior intacto. El temporal
+    toma los permisos del archivo que reemplaza (los de un archivo nuevo si no existe).
+    """
+    dir_path = os.path.dirname(path)
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        mode = _NEW_FILE_MODE
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        if hasattr(os, "fchmod"):
+            os.fchmod(fd, mode)
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(dir_path)
+
+
+def _write_replace(path, data):
+    _atomic_write(path, lambda f: f.write(data))
+
+
+def _copy_replace(src, dest):
+    def copy(f):
+        with open(src, "rb") as source:
+            shutil.copyfileobj(source, f)
+    _atomic_write(dest, copy)
+
+
+class NotebookFile:
+    """Lector de acceso aleatorio: solo lee la cabecera y la tabla al abrir."""
+
+    def __init__(self, path):
+        self.path = path
+        self.project_dir = os.path.dirname(path)
+        self.entries = []
+        with open(path, "rb") as f:
+            head = f.read(_HEADER.size)
+            if len(head) < _HEADER.size:
+                raise ContainerError(f"Cabecera incompleta: {path}")
+            magic, self.version, _flags, count = _HEADER.unpack(head)
+            if magic != MAGIC:
+                raise ContainerError(f"No es un cuaderno válido: {path}")
+            if self.version > CONTAINER_VERSION:
+                raise ContainerError(f"Versión de contenedor no soportada ({self.version}): {path}")
+
+            entry = _ENTRY_V1 if self.version == 1 else _ENTRY
+            table = f.read(entry.size * count)
+            if len(table) < entry.size * count:
+                raise ContainerError(f"Tabla de páginas incompleta: {path}")
+            self.entries = [entry.unpack_from(table, i * entry.size) for i in range(count)]
+
+    def page_count(self):
+        return len(self.entries)
+
+    def page_ids(self):
+        if self.version == 1:
+            # Las páginas del contenedor v1 no tienen id: se asignan al migrar
+            return [new_page_id() for _ in self.entries]
+        return [e[0].hex() for e in self.entries]
+
+    def read_blob(self, index):
+        if self.version == 1:
+            offset, length = self.entries[index]
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                blob = f.read(length)
+            if len(blob) != length:
+                raise ContainerError(f"Página {index + 1} truncada: {self.path}")
+            return blob
+
+        with open(page_path(self.project_dir, self.entries[index][0].hex()), "rb") as f:
+            return f.read()
+
+    def read_page(self, index):
+        return decode_page(self.read_blob(index))
+
+
+def write_manifest(project_dir, page_ids):
+    table = b"".join(_ENTRY.pack(bytes.fromhex(pid)) for pid in page_ids)
+    _write_replace(container_path(project_dir),
+                   _HEADER.pack(MAGIC, CONTAINER_VERSION, 0, len(page_ids)) + table)
+
+
+def create_project(project_dir):
+    """Crea la estructura vacía de una clase nueva."""
+    os.makedirs(os.path.join(project_dir, PAGES_DIR_NAME), exist_ok=True)
+    write_manifest(project_dir, [])
+
+
+def read_legacy_json(json_path):
+    """Lee un data.json v1 ("capas" en la raíz) o v2 ("pages") y devuelve la lista de páginas."""
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+
+    if "pages" in data:
+        return data["pages"]
+    # Formato V1 Legacy (Solo capas en root) -> Convertir a página 1
+    return [data.get("capas", [])]
+
+
+class SaveJob:
+    """
+    Instantánea de lo que hay que escribir en un guardado. Se arma en el hilo de la GUI
+    (solo referencias a datos que ya no se modifican) y se ejecuta en un hilo aparte.
+    """
+
+    def __init__(self, project_dir, pages, manifest_ids, assets=()):
+        self.project_dir = project_dir
+        self.pages = pages  # [(id, datos de página o blob ya codificado)]
+        self.manifest_ids = manifest_ids  # None si la lista de páginas no cambió
+        self.assets = list(assets)  # [(origen, destino)] imágenes a copiar a assets/ (con sus niveles)
+        self.silent = True
+        self.error = None
+
+    def run(self):
+        os.makedirs(os.path.join(self.project_dir, PAGES_DIR_NAME), exist_ok=True)
+        for pid, data in self.pages:
+            blob = data if isinstance(data, bytes) else encode_page(data)
+            _write_replace(page_path(self.project_dir, pid), blob)
+
+        # El manifiesto va al final: o apunta a las páginas viejas o a las nuevas
+        if self.manifest_ids is not None:
+            write_manifest(self.project_dir, self.manifest_ids)
+
+        for src, dest in self.assets:
+            try:
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                if not os.path.exists(dest):
+                    _copy_replace(src, dest)
+                image_assets.write_mips(dest)
+            except OSError as e:
+                print(f"No se pudo copiar {src}: {e}")
+
+
+class PageStore:
+    """
+    Páginas de un proyecto con id estable y marca de cambios.
+    Se comporta como una lista: store[i] lee la página del disco la primera vez,
+    store[i] = datos solo la marca sucia si el contenido cambió.
+
+    Las páginas parseadas viven en un LRU limitado por budget_bytes: al superarlo se
+    descartan las menos usadas (escribiéndolas antes si están sucias) y se vuelven
+    a leer de su archivo cuando hagan falta.
+    """
+
+    def __init__(self, project_dir=None, budget_bytes=DEFAULT_CACHE_BUDGET):
+        self.project_dir = project_dir
+        self.budget_bytes = budget_bytes
+        self.ids = []
+        self.pages = OrderedDict()  # id -> datos de página ya parseados (orden LRU)
+        self.sizes = {}  # id -> tamaño estimado
+        self.loaded_bytes = 0
+        self.dirty = set()  # ids a escribir en el próximo save()
+        self.in_flight = {}  # id -> datos que un guardado en curso todavía está escribiendo
+        self.manifest_dirty = False
+        self.source = None  # NotebookFile del que se migran las páginas de formatos anteriores
+        # Función (project_dir, id, datos) que se llama al escribir una página fuera de un
+        # guardado (al descartarla del caché estando sucia)
+        self.on_page_written = None
+
+    @classmethod
+    def open(cls, project_dir, budget_bytes=DEFAULT_CACHE_BUDGET):
+        """
+        Abre el proyecto. Los data.json v1/v2 y los contenedores v1 se migran al formato
+        actual en el momento (el JSON original se conserva como data.json.bak).
+        """
+        store = cls(project_dir, budget_bytes)
+        json_path = os.path.join(project_dir, LEGACY_JSON_NAME)
+
+        if os.path.exists(container_path(project_dir)):
+            store.source = NotebookFile(container_path(project_dir))
+            store.ids = store.source.page_ids()
+            if store.source.version < CONTAINER_VERSION:
+                store.dirty.update(store.ids)
+                store.manifest_dirty = True
+                store.save()
+        elif os.path.exists(json_path):
+            for page in read_legacy_json(json_path):
+                store.append(page)
+            # El manifiesto se escribe aunque no haya páginas ("Hoy" crea data.json vacíos)
+            store.manifest_dirty = True
+            store.save()
+            if os.path.exists(container_path(project_dir)):
+                os.replace(json_path, json_path + ".bak")
+
+        return store
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        pid = self.ids[index]
+        if pid in self.pages:
+            self.pages.move_to_end(pid)
+            return self.pages[pid]
+
+        if pid in self.in_flight:
+            page_data = self.in_flight[pid]
+            if isinstance(page_data, bytes):
+                page_data = decode_page(page_data)
+        else:
+            page_data = read_page_file(self.project_dir, pid)
+        self._put(pid, page_data)
+        return page_data
+
+    def __setitem__(self, index, page_data):
+        pid = self.ids[index]
+        if self.pages.get(pid) != page_data:
+            self.dirty.add(pid)
+        self._put(pid, page_data)
+
+    def append(self, page_data):
+        pid = new_page_id()
+        self.ids.append(pid)
+        self.dirty.add(pid)
+        self.manifest_dirty = True
+        self._put(pid, page_data)
+
+    def is_loaded(self, index):
+        return self.ids[index] in self.pages
+
+    def _put(self, pid, page_data):
+        self.loaded_bytes -= self.sizes.get(pid, 0)
+        self.pages[pid] = page_data
+        self.pages.move_to_end(pid)
+        self.sizes[pid] = estimate_page_size(page_data)
+        self.loaded_bytes += self.sizes[pid]
+        self._evict()
+
+    def _evict(self):
+        """Descarta páginas LRU hasta entrar en el presupuesto. La más reciente nunca se descarta."""
+        if self.loaded_bytes <= self.budget_bytes:
+            return
+        for pid in list(self.pages)[:-1]:
+            if pid in self.dirty:
+                if not self.project_dir or pid in self.in_flight:
+                    # Sesión sin guardar, o un guardado en curso escribiría encima una versión anterior
+                    continue
+                # El manifiesto queda para el próximo guardado
+                self._write_page(pid, self.pages[pid])
+                self.dirty.discard(pid)
+                if self.on_page_written is not None:
+                    self.on_page_written(self.project_dir, pid, self.pages[pid])
+
+            del self.pages[pid]
+            self.loaded_bytes -= self.sizes.pop(pid)
+            if self.loaded_bytes <= self.budget_bytes:
+                break
+
+    def _write_page(self, pid, page_data):
+        os.makedirs(os.path.join(self.project_dir, PAGES_DIR_NAME), exist_ok=True)
+        _write_replace(page_path(self.project_dir, pid), encode_page(page_data))
+
+    def is_dirty(self, index):
+        return self.ids[index] in self.dirty
+
+    def snapshot(self, assets=()):
+        """
+        Toma las páginas sucias (y el manifiesto si cambió) en un SaveJob y las da por guardadas.
+        Devuelve None si no hay nada que escribir. Llamar a finish_save() cuando el job termine.
+        """
+        if not self.dirty and not self.manifest_dirty and not assets:
+            return None
+
+        pages = []
+        for i, pid in enumerate(self.ids):
+            if pid not in self.dirty:
+                continue
+            if pid in self.pages:
+                data = self.pages[pid]
+            else:
+                # Migración: el blob se copia tal cual desde el contenedor anterior
+                data = self.source.read_blob(i)
+            pages.append((pid, data))
+            self.in_flight[pid] = data
+
+        job = SaveJob(self.project_dir, pages, list(self.ids) if self.manifest_dirty else None, assets)
+        self.dirty.clear()
+        self.manifest_dirty = False
+        return job
+
+    def finish_save(self, job):
+        """Cierra un SaveJob. Si falló, sus páginas vuelven a quedar sucias para el próximo intento."""
+        for pid, data in job.pages:
+            if self.in_flight.get(pid) is data:
+                del self.in_flight[pid]
+                if job.error and pid not in self.pages:
+                    self._put(pid, decode_page(data) if isinstance(data, bytes) else data)
+            if job.error:
+                self.dirty.add(pid)
+        if job.error and job.manifest_ids is not None:
+            self.manifest_dirty = True
+        if job.manifest_ids is not None and not job.error:
+            self.source = None
+
+    def save(self):
+        """Guardado síncrono: escribe solo las páginas modificadas y el manifiesto. Devuelve cuántas escribió."""
+        job = self.snapshot()
+        if job is None:
+            return 0
+        try:
+            job.run()
+        except Exception as e:
+            job.error = e
+            raise
+        finally:
+            self.finish_save(job)
+        return len(job.pages)
@@ -0,0 +1,301 @@
+from PyQt6.QtGui import QPainterPath
+from PyQt6.QtWidgets import QGraphicsPathItem
+
+try:
+    import numpy as np
+except ImportError:  # Sin numpy los trazos se guardan tal cual llegaron
+    np = None
+
+# Geometría de los trazos al confirmarlos: el lápiz entrega cada muestra del mouse como
+# un lineTo. Se simplifica con Ramer-Douglas-Peucker y se ajustan curvas cúbicas
+# (Schneider, "An Algorithm for Automatically Fitting Digitized Curves", Graphics Gems)
+# dentro de la tolerancia, cortando en las esquinas para no redondearlas.
+
+CORNER_ANGLE_COS = 0.35  # Giro de más de ~70° entre segmentos = esquina
+MIN_POINTS = 6  # Trazos más cortos (puntos, formas) quedan como están
+MAX_REPARAM = 4
+
+
+def stroke_tolerance(zoom, suavizado_nivel):
+    """Tolerancia en unidades de escena: entre 0.5 y 2 px de pantalla según el suavizado."""
+    return (0.5 + 1.5 * suavizado_nivel / 100) / (zoom or 1)
+
+
+# --- RAMER-DOUGLAS-PEUCKER ---
+
+def simplify_rdp(points, tolerance):
+    """
+    Índices de los puntos que quedan (primero y último incluidos). points: array (n, 2).
+    Todos los tramos pendientes se parten a la vez: una pasada vectorizada por nivel de la
+    recursión en lugar de una por punto que queda.
+    """
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    if n < 3:
+        return np.flatnonzero(keep)
+    tol2 = tolerance * tolerance
+    xs, ys = points[:, 0], points[:, 1]
+    positions = np.arange(n)
+    while True:
+        kept = np.flatnonzero(keep)
+        # Tramo (entre dos puntos que quedan) de cada punto
+        seg = np.minimum(np.searchsorted(kept, positions, side="right") - 1, len(kept) - 2)
+        first, last = kept[seg], kept[seg + 1]
+        ax, ay = xs[first], ys[first]
+        abx, aby = xs[last] - ax, ys[last] - ay
+        apx, apy = xs - ax, ys - ay
+        length2 = abx * abx + aby * aby
+        # Distancia al segmento (no a la recta: los trazos pueden volver sobre sí mismos)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.clip((apx * abx + apy * aby) / length2, 0, 1)
+        t[length2 == 0] = 0
+        dx, dy = apx - t * abx, apy - t * aby
+        d2 = dx * dx + dy * dy
+        d2[keep] = 0
+
+        worst = np.maximum.reduceat(d2, kept[:-1])
+        split = np.flatnonzero((d2 > tol2) & (d2 == worst[seg]))
+        if not len(split):
+            return kept
+        # Un solo punto por tramo: el primero con la distancia máxima
+        _segs, first_hit = np.unique(seg[split], return_index=True)
+        keep[split[first_hit]] = True
+
+
+# --- AJUSTE DE CÚBICAS ---
+
+def _bezier(ctrl, t):
+    mt = 1 - t
+    return ((mt ** 3)[:, None] * ctrl[0] + (3 * mt * mt * t)[:, None] * ctrl[1]
+            + (3 * mt * t * t)[:, None] * ctrl[2] + (t ** 3)[:, None] * ctrl[3])
+
+
+def _bezier_d1(ctrl, t):
+    mt = 1 - t
+    return 3 * ((mt * mt)[:, None] * (ctrl[1] - ctrl[0]) + (2 * mt * t)[:, None] * (ctrl[2] - ctrl[1])
+                + (t * t)[:, None] * (ctrl[3] - ctrl[2]))
+
+
+def _bezier_d2(ctrl, t):
+    return 6 * ((1 - t)[:, None] * (ctrl[2] - 2 * ctrl[1] + ctrl[0]) + t[:, None] * (ctrl[3] - 2 * ctrl[2] + ctrl[1]))
+
+
+def _unit(v):
+    norm = np.hypot(v[0], v[1])
+    return v / norm if norm > 0 else v
+
+
+def _chord_params(points):
+    d = np.concatenate(([0.0], np.cumsum(np.hypot(*np.diff(points, axis=0).T))))
+    return d / d[-1] if d[-1] > 0 else np.linspace(0, 1, len(points))
+
+
+def _generate(points, u, t_left, t_right):
+    """Cúbica por mínimos cuadrados con extremos fijos y tangentes dadas (solo se ajustan las longitudes)."""
+    p0, p3 = points[0], points[-1]
+    mt = 1 - u
+    b0, b1, b2, b3 = mt ** 3, 3 * u * mt * mt, 3 * u * u * mt, u ** 3
+    a1 = b1[:, None] * t_left
+    a2 = b2[:, None] * t_right
+    c00, c01, c11 = (a1 * a1).sum(), (a1 * a2).sum(), (a2 * a2).sum()
+    rest = points - (np.outer(b0 + b1, p0) + np.outer(b2 + b3, p3))
+    x0, x1 = (a1 * rest).sum(), (a2 * rest).sum()
+
+    det = c00 * c11 - c01 * c01
+    alpha_l = (x0 * c11 - x1 * c01) / det if abs(det) > 1e-12 else 0.0
+    alpha_r = (c00 * x1 - c01 * x0) / det if abs(det) > 1e-12 else 0.0
+    seg_len = np.hypot(*(p3 - p0))
+    if not (1e-6 * seg_len < alpha_l < 2 * seg_len and 1e-6 * seg_len < alpha_r < 2 * seg_len):
+        # Sistema mal condicionado (o manijas que harían un bucle entre muestras): heurística de Wu/Barsky
+        alpha_l = alpha_r = seg_len / 3
+    return np.array([p0, p0 + t_left * alpha_l, p3 + t_right * alpha_r, p3])
+
+
+def _reparameterize(ctrl, points, u):
+    """Un paso de Newton-Raphson hacia el parámetro del punto de la curva más cercano a cada muestra."""
+    diff = _bezier(ctrl, u) - points
+    d1 = _bezier_d1(ctrl, u)
+    d2 = _bezier_d2(ctrl, u)
+    num = (diff * d1).sum(axis=1)
+    den = (d1 * d1).sum(axis=1) + (diff * d2).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        step = np.where(den != 0, num / den, 0.0)
+    return np.clip(u - step, 0, 1)
+
+
+def _max_error(ctrl, points, u):
+    d2 = ((_bezier(ctrl, u) - points) ** 2).sum(axis=1)
+    i = int(np.argmax(d2))
+    return d2[i], i
+
+
+def _raw_error(ctrl, raw, raw_idx, u):
+    """
+    Mayor error (al cuadrado) de las muestras originales del tramo y su índice. Su parámetro
+    sale de interpolar el de los puntos que quedaron según la longitud recorrida, más dos
+    pasos de Newton hacia el punto más cercano de la curva.
+    """
+    cum = np.concatenate(([0.0], np.cumsum(np.hypot(*np.diff(raw, axis=0).T))))
+    u_raw = np.interp(cum, cum[raw_idx], u)
+    for _ in range(2):
+        u_raw = _reparameterize(ctrl, raw, u_raw)
+    return _max_error(ctrl, raw, u_raw)
+
+
+def fit_cubics(points, tolerance, t_left=None, t_right=None, raw=None, raw_idx=None):
+    """
+    Lista de cúbicas (arrays (4, 2)) que pasan a menos de `tolerance` de todos los puntos.
+    Si `points` son los que dejó RDP, `raw` son las muestras originales del tramo y
+    `raw_idx` la posición de cada punto en `raw`: cada curva se valida también contra ellas.
+    """
+    if raw is None:
+        raw, raw_idx = points, np.arange(len(points))
+    if t_left is None:
+        t_left = _unit(points[1] - points[0])
+    if t_right is None:
+        t_right = _unit(points[-2] - points[-1])
+
+    tol2 = tolerance * tolerance
+    if len(points) == 2:
+        dist = np.hypot(*(points[1] - points[0])) / 3
+        ctrl = np.array([points[0], points[0] + t_left * dist, points[1] + t_right * dist, points[1]])
+        if len(raw) > 2 and _raw_error(ctrl, raw, raw_idx, np.array([0.0, 1.0]))[0] > tol2:
+            # Las tangentes lo curvan de más: el segmento recto ya está dentro de la tolerancia (RDP)
+            chord = (points[1] - points[0]) / 3
+            ctrl = np.array([points[0], points[0] + chord, points[1] - chord, points[1]])
+        return [ctrl]
+
+    u = _chord_params(points)
+    ctrl = _generate(points, u, t_left, t_right)
+    err, split = _max_error(ctrl, points, u)
+    for attempt in range(MAX_REPARAM + 1):
+        if attempt:
+            if err > tol2 * 4:
+                break
+            u = _reparameterize(ctrl, points, u)
+            ctrl = _generate(points, u, t_left, t_right)
+            err, split = _max_error(ctrl, points, u)
+        if err <= tol2:
+            if len(raw) == len(points):
+                return [ctrl]
+            raw_err, raw_split = _raw_error(ctrl, raw, raw_idx, u)
+            if raw_err <= tol2:
+                return [ctrl]
+            # Alguna muestra original queda lejos: se parte en el punto más cercano a ella
+            split = int(np.searchsorted(raw_idx, raw_split))
+            break
+
+    # Partir en el punto de mayor error, con tangente continua
+    split = min(max(split, 1), len(points) - 2)
+    t_center = _unit(points[split - 1] - points[split + 1])
+    cut = raw_idx[split]
+    return (fit_cubics(points[:split + 1], tolerance, t_left, t_center, raw[:cut + 1], raw_idx[:split + 1])
+            + fit_cubics(points[split:], tolerance, -t_center, t_right, raw[cut:], raw_idx[split:] - cut))
+
+
+def _corner_runs(points):
+    """
+    Parte la polilínea en tramos sin esquinas (las esquinas quedan en los extremos de los
+    tramos). Devuelve [(primero, último)] índices de `points`.
+    """
+    v = np.diff(points, axis=0)
+    norms = np.hypot(v[:, 0], v[:, 1])
+    norms[norms == 0] = 1
+    v = v / norms[:, None]
+    cos = (v[:-1] * v[1:]).sum(axis=1)
+    corners = np.flatnonzero(cos < CORNER_ANGLE_COS) + 1
+    bounds = [0] + corners.tolist() + [len(points) - 1]
+    return [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+# --- QPainterPath ---
+
+def _polyline_subpaths(path):
+    """Subtrazos de solo moveTo/lineTo como arrays (n, 2); None si el trazo ya tiene curvas."""
+    subpaths = []
+    current = []
+    for k in range(path.elementCount()):
+        e = path.elementAt(k)
+        if e.isMoveTo():
+            if current:
+                subpaths.append(current)
+            current = [(e.x, e.y)]
+        elif e.isLineTo():
+            current.append((e.x, e.y))
+        else:
+            return None
+    if current:
+        subpaths.append(current)
+    return [np.array(sub, dtype=float) for sub in subpaths]
+
+
+def simplify_path(path, tolerance):
+    """
+    Versión simplificada y ajustada con cúbicas de un trazo hecho de lineTo.
+    Devuelve None si no hay nada que hacer (sin numpy, trazo corto o que ya tiene curvas).
+    """
+    if np is None or path.elementCount() < MIN_POINTS:
+        return None
+    subpaths = _polyline_subpaths(path)
+    if subpaths is None:
+        return None
+
+    result = QPainterPath()
+    for points in subpaths:
+        # Muestras repetidas (mouse quieto) no aportan nada
+        if len(points) > 1:
+            moved = np.any(np.diff(points, axis=0) != 0, axis=1)
+            points = points[np.concatenate(([True], moved))]
+        result.moveTo(*points[0])
+        if len(points) == 1:
+            result.lineTo(*points[0])  # Un toque: punto de largo 0, como lo deja el lápiz
+            continue
+
+        keep = simplify_rdp(points, tolerance)
+        kept = points[keep]
+        for a, b in _corner_runs(kept):
+            if b - a == 1:
+                result.lineTo(*kept[b])  # RDP ya garantiza la tolerancia del segmento
+                continue
+            # Se ajusta sobre los puntos de RDP y se valida contra las muestras originales
+            raw = points[keep[a]:keep[b] + 1]
+            for ctrl in fit_cubics(kept[a:b + 1], tolerance, raw=raw, raw_idx=keep[a:b + 1] - keep[a]):
+                result.cubicTo(*ctrl[1], *ctrl[2], *ctrl[3])
+    return result
+
+
+def polyline_lod(path, tolerance):
+    """
+    Polilínea simplificada de cualquier path (las curvas se aplanan), para dibujarlo con
+    poco detalle. None sin numpy.
+    """
+    if np is None:
+        return None
+    result = QPainterPath()
+    result.setFillRule(path.fillRule())
+    for poly in path.toSubpathPolygons():
+        # Copia directa de los QPointF, como en spatial_index
+        ptr = poly.data()
+        ptr.setsize(len(poly) * 16)
+        points = np.frombuffer(ptr.asstring(), dtype=float).reshape(-1, 2)
+        if len(points) > 2:
+            points = points[simplify_rdp(points, tolerance)]
+        result.moveTo(*points[0])
+        for x, y in points[1:].tolist():
+            result.lineTo(x, y)
+    return result
+
+
+def simplify_stroke_item(item, tolerance):
+    """Reemplaza el path de un trazo recién dibujado por su versión ajustada si tiene menos elementos."""
+    if not isinstance(item, QGraphicsPathItem):
+        return False
+    # La tolerancia es de escena: pasarla a coordenadas del item
+    scale = abs(item.sceneTransform().determinant()) ** 0.5 or 1.0
+    path = item.path()
+    fitted = simplify_path(path, tolerance / scale)
+    if fitted is None or fitted.elementCount() >= path.elementCount():
+        return False
+    item.setPath(fitted)
+    return True
@@ -0,0 +1,248 @@
+import os
+import hashlib
+
+from PyQt6.QtCore import Qt, QObject, QRunnable, QThreadPool, QRectF, QSize, QTimer, pyqtSignal
+from PyQt6.QtGui import QImage, QPainter, QPen, QColor, QBrush, QFont, QTransform, QPixmap, QIcon
+from PyQt6.QtWidgets import QListWidget, QListWidgetItem, QListView
+
+from config import ANCHO_LIENZO, ALTO_LIENZO
+import image_assets
+import serializers
+import storage
+
+THUMBS_DIR_NAME = "thumbs"
+THUMB_WIDTH = 96
+THUMB_HEIGHT = round(ALTO_LIENZO * THUMB_WIDTH / ANCHO_LIENZO)
+
+
+# --- RENDER DIRECTO DESDE LOS DATOS (sin escena, apto para hilos de trabajo) ---
+
+def item_transform(item_data):
+    """Misma transformación que aplica build_page_scene: escala, rotación, transform y posición."""
+    base = QTransform()
+    if "m11" in item_data:
+        base = QTransform(item_data["m11"], item_data["m12"], item_data["m21"], item_data["m22"], 0, 0)
+    s = item_data.get("scale", 1)
+    rot = QTransform()
+    rot.rotate(item_data.get("rot", 0))
+    return QTransform.fromScale(s, s) * rot * base * QTransform.fromTranslate(item_data["pos_x"], item_data["pos_y"])
+
+
+def paint_page(painter, page_data, assets_dir):
+    """Pinta una página serializada con un QPainter (coordenadas de escena). Usa QImage, nunca QPixmap."""
+    palette = serializers.page_palette(page_data)
+    base = painter.transform()
+
+    # La capa 0 es la superior: se pinta de la última a la primera
+    for layer_data in reversed(serializers.page_layers(page_data)):
+        if not layer_data.get("visible", True):
+            continue
+        for item_data in layer_data.get("items", []):
+            painter.setTransform(item_transform(item_data) * base)
+            type_str = item_data.get("type")
+
+            if type_str == "path":
+                if item_data.get("has_pen", True):
+                    pen_color, pen_width = serializers.item_pen(item_data, palette)
+                    pen = QPen(QColor(pen_color))
+                    pen.setWidth(pen_width)
+                    pen.setCapStyle(Qt.PenCapStyle.RoundCap)
+                    pen.setJoinStyle(Qt.PenJoinStyle.RoundJoin)
+                    painter.setPen(pen)
+                else:
+                    painter.setPen(Qt.PenStyle.NoPen)
+                if item_data.get("has_fill", False):
+                    painter.setBrush(QBrush(QColor(item_data["fill_color"])))
+                else:
+                    painter.setBrush(Qt.BrushStyle.NoBrush)
+                painter.drawPath(serializers.decode_path(item_data))
+
+            elif type_str == "text":
+                painter.setFont(QFont(item_data["font_family"], item_data["font_size"]))
+                painter.setPen(QColor(item_data["color"]))
+                # 4px = margen del documento de QGraphicsTextItem
+                painter.drawText(QRectF(4, 4, ANCHO_LIENZO, ALTO_LIENZO),
+                                 Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop, item_data["content"])
+
+            elif type_str == "image":
+                fname = item_data.get("img_filename")
+                ipath = os.path.join(assets_dir, fname) if fname and assets_dir else ""
+                if "img_w" in item_data:
+                    size = QSize(item_data["img_w"], item_data["img_h"])
+                else:
+                    size = image_assets.image_size(ipath)
+                if not size.isValid():
+                    continue
+                # El nivel reducido que alcanza para la resolución con la que se va a pintar
+                device_scale = painter.transform().m11() or 1
+                level = image_assets.level_for_scale(device_scale, image_assets.mip_count(size.width(), size.height()))
+                image = image_assets.read_level(ipath, size, item_data.get("mips", 0), level)
+                if not image.isNull():
+                    painter.drawImage(QRectF(0, 0, size.width(), size.height()), image)
+
+    painter.setTransform(base)
+
+
+def render_page_image(page_data, assets_dir, width=THUMB_WIDTH):
+    scale = width / ANCHO_LIENZO
+    image = QImage(width, round(ALTO_LIENZO * scale), QImage.Format.Format_ARGB32_Premultiplied)
+    image.fill(Qt.GlobalColor.white)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+    painter.scale(scale, scale)
+    paint_page(painter, page_data, assets_dir)
+    painter.end()
+    return image
+
+
+# --- SERVICIO EN SEGUNDO PLANO CON CACHÉ EN DISCO ---
+
+def thumb_path(project_dir, page_id, content_hash):
+    return os.path.join(project_dir, THUMBS_DIR_NAME, f"{page_id}-{content_hash}.png")
+
+
+class ThumbnailTask(QRunnable):
+    """
+    Lee el archivo de la página, calcula su hash y devuelve la miniatura cacheada
+    en thumbs/ o la renderiza y la guarda. Todo fuera del hilo de la GUI.
+    """
+
+    def __init__(self, project_dir, page_id, done_signal):
+        super().__init__()
+        self.project_dir = project_dir
+        self.page_id = page_id
+        self.done_signal = done_signal
+
+    def run(self):
+        image = QImage()
+        try:
+            with open(storage.page_path(self.project_dir, self.page_id), "rb") as f:
+                blob = f.read()
+            content_hash = hashlib.sha1(blob).hexdigest()[:16]
+            path = thumb_path(self.project_dir, self.page_id, content_hash)
+
+            if os.path.exists(path):
+                image = QImage(path)
+            if image.isNull():
+                image = render_page_image(storage.decode_page(blob), os.path.join(self.project_dir, "assets"))
+                self._store(image, path)
+        except FileNotFoundError:
+            pass  # Página aún sin guardar: se pide de nuevo cuando se guarde
+        except Exception as e:
+            # Archivo dañado: se queda sin miniatura
+            print(f"miniatura {self.page_id}: {e}")
+        self.done_signal.emit(self.project_dir, self.page_id, image)
+
+    def _store(self, image, path):
+        thumbs_dir = os.path.dirname(path)
+        os.makedirs(thumbs_dir, exist_ok=True)
+        # Borrar las versiones viejas de esta página
+        for name in os.listdir(thumbs_dir):
+            if name.startswith(self.page_id + "-"):
+                os.remove(os.path.join(thumbs_dir, name))
+        tmp_path = path + ".tmp.png"
+        image.save(tmp_path, "PNG")
+        os.replace(tmp_path, path)
+
+
+class ThumbnailService(QObject):
+    """Genera miniaturas en un pool propio. Cada página se pide a lo sumo una vez por vez."""
+    thumbnail_ready = pyqtSignal(str, str, QImage)  # project_dir, page_id, imagen (nula si falló)
+    _task_done = pyqtSignal(str, str, QImage)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(1, QThreadPool.globalInstance().maxThreadCount() // 2))
+        self.in_progress = set()
+        self._task_done.connect(self._on_task_done)
+
+    def request(self, project_dir, page_id):
+        key = (project_dir, page_id)
+        if key in self.in_progress:
+            return
+        self.in_progress.add(key)
+        self.pool.start(ThumbnailTask(project_dir, page_id, self._task_done))
+
+    def stop(self):
+        """Descarta lo que falte empezar y espera a las tareas en curso (al cerrar)."""
+        self.pool.clear()
+        self.pool.waitForDone()
+        self.in_progress.clear()
+
+    def _on_task_done(self, project_dir, page_id, image):
+        self.in_progress.discard((project_dir, page_id))
+        self.thumbnail_ready.emit(project_dir, page_id, image)
+
+
+# --- TIRA DE PÁGINAS ---
+
+class PageStrip(QListWidget):
+    """Tira horizontal de miniaturas. Solo pide al servicio las que están a la vista."""
+    page_clicked = pyqtSignal(int)
+
+    def __init__(self, service, parent=None):
+        super().__init__(parent)
+        self.service = service
+        self.project_dir = None
+        self.page_ids = []
+        self.loaded = set()  # page_ids con miniatura al día
+
+        self.setViewMode(QListView.ViewMode.IconMode)
+        self.setFlow(QListView.Flow.LeftToRight)
+        self.setWrapping(False)
+        self.setMovement(QListView.Movement.Static)
+        self.setIconSize(QSize(THUMB_WIDTH, THUMB_HEIGHT))
+        self.setFixedHeight(THUMB_HEIGHT + 50)
+        self.setSpacing(6)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+
+        placeholder = QPixmap(THUMB_WIDTH, THUMB_HEIGHT)
+        placeholder.fill(QColor("#f0f0f0"))
+        self.placeholder_icon = QIcon(placeholder)
+
+        self.itemClicked.connect(lambda item: self.page_clicked.emit(self.row(item)))
+        self.horizontalScrollBar().valueChanged.connect(self.request_visible)
+        service.thumbnail_ready.connect(self.on_thumbnail_ready)
+
+    def set_pages(self, project_dir, page_ids, current_index):
+        self.project_dir = project_dir
+        self.page_ids = list(page_ids)
+        self.loaded.clear()
+        self.clear()
+        for i in range(len(self.page_ids)):
+            self.addItem(QListWidgetItem(self.placeholder_icon, str(i + 1)))
+        self.set_current(current_index)
+        # Esperar al layout para saber qué items quedan visibles
+        QTimer.singleShot(0, self.request_visible)
+
+    def set_current(self, index):
+        if 0 <= index < self.count():
+            self.setCurrentRow(index)
+            self.scrollToItem(self.item(index))
+
+    def invalidate(self, page_ids):
+        """Las páginas recién guardadas cambiaron de hash: volver a pedir su miniatura."""
+        self.loaded.difference_update(page_ids)
+        self.request_visible()
+
+    def request_visible(self):
+        if not self.project_dir:
+            return
+        viewport_rect = self.viewport().rect()
+        for row, page_id in enumerate(self.page_ids):
+            if page_id in self.loaded:
+                continue
+            if self.visualItemRect(self.item(row)).intersects(viewport_rect):
+                self.service.request(self.project_dir, page_id)
+
+    def on_thumbnail_ready(self, project_dir, page_id, image):
+        if project_dir != self.project_dir or page_id not in self.page_ids or image.isNull():
+            return
+        self.loaded.add(page_id)
+        self.item(self.page_ids.index(page_id)).setIcon(QIcon(QPixmap.fromImage(image)))
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.request_visible()
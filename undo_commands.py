@@ -1,5 +1,30 @@
 from PyQt6.QtGui import QUndoCommand
 
+from serializers import invalidate_item
+from spatial_index import scene_index
+from stroke_geometry import simplify_stroke_item
+
+
+def _index_insert(scene, items):
+    index = scene_index(scene)
+    if index is not None:
+        for item in items:
+            index.insert(item)
+
+
+def _index_remove(scene, items):
+    index = scene_index(scene)
+    if index is not None:
+        for item in items:
+            index.remove(item)
+
+
+def _layer_changed(item):
+    """Avisa a la capa del item (si está aplanada, su grabación quedó vieja)."""
+    capa = getattr(item.parentItem(), "capa", None)
+    if capa is not None:
+        capa.contents_changed()
+
 
 class CommandAdd(QUndoCommand):
     def __init__(self, scene, item, capa_data, main_window):
@@ -9,19 +34,23 @@ class CommandAdd(QUndoCommand):
         self.capa_data = capa_data
         self.main = main_window
         self.setText("Agregar Item")
+        # Un trazo recién dibujado trae cada muestra del mouse: se simplifica una sola vez, al confirmarlo
+        simplify_stroke_item(item, main_window.stroke_tolerance())
 
     def redo(self):
-        if self.item.scene() != self.scene:
-            self.scene.addItem(self.item)
+        # La herramienta pudo modificar el item antes de confirmarlo
+        invalidate_item(self.item)
         if self.item not in self.capa_data.items:
-            self.capa_data.items.append(self.item)
-        self.main.actualizar_z_values()
+            # Al colgar del contenedor de la capa el item entra en su escena
+            self.capa_data.add_item(self.item)
+        _index_insert(self.scene, [self.item])
 
     def undo(self):
         if self.item.scene() == self.scene:
             self.scene.removeItem(self.item)
         if self.item in self.capa_data.items:
-            self.capa_data.items.remove(self.item)
+            self.capa_data.remove_item(self.item)
+        _index_remove(self.scene, [self.item])
 
 
 class CommandDelete(QUndoCommand):
@@ -36,16 +65,15 @@ class CommandDelete(QUndoCommand):
             if item.scene() == self.scene:
                 self.scene.removeItem(item)
             if item in capa.items:
-                capa.items.remove(item)
+                capa.remove_item(item)
+        _index_remove(self.scene, [item for item, _capa in self.items])
 
     def undo(self):
+        # Cada item vuelve a su lugar en la capa según el z local que conservó
         for item, capa in self.items:
-            if item.scene() != self.scene:
-                self.scene.addItem(item)
             if item not in capa.items:
-                capa.items.append(item)
-        # Restaurar Z
-        item.setZValue(item.zValue())  # Hack para trigger update si es necesario
+                capa.restore_item(item)
+        _index_insert(self.scene, [item for item, _capa in self.items])
 
 
 class CommandMoveRotate(QUndoCommand):
@@ -64,11 +92,15 @@ class CommandMoveRotate(QUndoCommand):
         self.item.setPos(self.new_pos)
         self.item.setRotation(self.new_rot)
         self.item.setScale(self.new_scale)
+        _index_insert(self.item.scene(), [self.item])
+        _layer_changed(self.item)
 
     def undo(self):
         self.item.setPos(self.old_pos)
         self.item.setRotation(self.old_rot)
         self.item.setScale(self.old_scale)
+        _index_insert(self.item.scene(), [self.item])
+        _layer_changed(self.item)
 
 
 class CommandReplace(QUndoCommand):
@@ -96,17 +128,15 @@ class CommandReplace(QUndoCommand):
         if self.old_item.scene() == self.scene:
             self.scene.removeItem(self.old_item)
         if self.old_item in self.capa_data.items:
-            self.capa_data.items.remove(self.old_item)
-
-        # Insertar nuevos en la misma posición de la lista
-        # Invertimos para insertar en orden correcto (LIFO insert -> orden original)
-        for item in reversed(self.new_items):
-            if item.scene() != self.scene:
-                self.scene.addItem(item)
-            if item not in self.capa_data.items:
-                self.capa_data.items.insert(self.insert_index, item)
+            self.capa_data.remove_item(self.old_item)
 
-        self.main.actualizar_z_values()
+        # Insertar nuevos en la misma posición de la lista, con z entre los vecinos
+        for item in self.new_items:
+            invalidate_item(item)
+        self.capa_data.insert_items(self.insert_index,
+                                    [item for item in self.new_items if item not in self.capa_data.items])
+        _index_remove(self.scene, [self.old_item])
+        _index_insert(self.scene, self.new_items)
 
     def undo(self):
         # Quitar nuevos
@@ -114,12 +144,10 @@ class CommandReplace(QUndoCommand):
             if item.scene() == self.scene:
                 self.scene.removeItem(item)
             if item in self.capa_data.items:
-                self.capa_data.items.remove(item)
+                self.capa_data.remove_item(item)
 
-        # Restaurar viejo
-        if self.old_item.scene() != self.scene:
-            self.scene.addItem(self.old_item)
+        # Restaurar viejo (conserva su z local)
         if self.old_item not in self.capa_data.items:
-            self.capa_data.items.insert(self.insert_index, self.old_item)
-
-        self.main.actualizar_z_values()
\ No newline at end of file
+            self.capa_data.restore_item(self.old_item)
+        _index_remove(self.scene, self.new_items)
+        _index_insert(self.scene, [self.old_item])
\ No newline at end of file